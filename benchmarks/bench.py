@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench.py
+Benchmarks of the hot paths of hydrx at production scale
+
+Every benchmark prepares its data and returns a function to time, sizes are
+multiplied by the scale parameter. The best time of several repetitions is
+appended to a history file (one JSON record per run) and compared against a
+baseline, the benchmarks slower than the baseline by more than the
+tolerance are flagged as regressions.
+
+The weather benchmarks use synthetic multi-year AZMET files written to a
+temporary cache, no connection is needed. For example:
+
+    python bench.py --scale 0.1
+    python bench.py --save-baseline
+    python bench.py --only manning,scs_storm --repeat 5
+    python bench.py --only import_manning,import_scs_storm --import-budget 0.2
+
+The import benchmarks time the cold start of a new interpreter using the
+package-level API (hydrx.py), the light ones fail if they load pandas,
+matplotlib or requests or take longer than the budget.
+
+@author: eduardo
+"""
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import contextlib
+from datetime import datetime
+import numpy as np
+import pandas as pd
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+from manning import manningQ, Trapezoidal, Circle
+from channel import design_channel, normal_depth_batch
+from riprap import riprapCSU, riprap_size
+from lateral import Lateral, design_laterals
+from rainfall import SCSStorm
+from cache import WeatherCache
+from weather import WeatherData, BlanneyCriddle
+import registry
+
+# Next to this file, whatever the working directory
+HISTORY_FILE = os.path.join(BENCH_DIR, 'history.jsonl')
+BASELINE_FILE = os.path.join(BENCH_DIR, 'baseline.json')
+SRC = os.path.join(BENCH_DIR, '..', 'src')
+
+# Cold start of worker processes: statements timed in a new interpreter,
+# the light ones should not load the heavy dependencies and meet the budget
+IMPORTS = {'import_manning': 'import hydrx; hydrx.manningQ',
+           'import_scs_storm': 'import hydrx; hydrx.SCSStorm',
+           'import_sensitivity': 'import hydrx; hydrx.sensitivity',
+           'import_weather': 'import hydrx; hydrx.WeatherData'}
+LIGHT_IMPORTS = ['import_manning', 'import_scs_storm', 'import_sensitivity']
+HEAVY_MODULES = ['pandas', 'matplotlib', 'requests']
+
+def size(n, scale):
+    """ Number of elements of a benchmark for a scale, at least one """
+    return max(int(n * scale), 1)
+
+def bench_manning(scale):
+    """ manningQ and the section getters over 10^6 depths """
+    y = np.linspace(0.01, 5., size(1E6, scale))
+    trap = Trapezoidal(3., 1.5, y)
+    pipe = Circle(6., y)
+    def run():
+        for section in (trap, pipe):
+            section.setDepth(y)
+            A, R = section.getArea(), section.getHydraulicRadius()
+            section.getWettedPerimeter()
+            section.getTopWidth()
+            manningQ(0.015, A, R, 0.001)
+    return run
+
+def bench_design_channel(scale):
+    """ design_channel convergence for single channels (quiet) """
+    Qs = np.linspace(1., 100., size(200, scale))
+    def run():
+        for Q in Qs:
+            design_channel(0.025, 0.001, Q, base=2., z=1.5, disp=0)
+    return run
+
+def bench_normal_depth_batch(scale):
+    """ Normal depth of 10^5 channels in one batch """
+    rng = np.random.default_rng(0)
+    m = size(1E5, scale)
+    n, S, Q = rng.uniform(0.012, 0.04, m), rng.uniform(1E-4, 1E-2, m), rng.uniform(1., 200., m)
+    B, z = rng.uniform(0.5, 10., m), rng.uniform(0., 3., m)
+    return lambda: normal_depth_batch(n, S, Q, B, z)
+
+def bench_riprap(scale):
+    """ riprapCSU iterations for single channels """
+    slopes = np.linspace(0.02, 0.1, size(10, scale))
+    def run():
+        for S in slopes:
+            riprapCSU(18., 115., S, 42., 5.71, 2.65, 1.5, False)
+    return run
+
+def bench_riprap_size(scale):
+    """ Riprap size of 10^6 channels in one batch """
+    S = np.linspace(0.01, 0.1, size(1E6, scale))
+    return lambda: riprap_size(18., 115., S, 42., 5.71, 2.65, 1.5, False)
+
+def _fields(m, rng):
+    return pd.DataFrame({'sprinkler_flow': rng.uniform(0.2, 0.6, m),
+                         'sprinkler_pressure': rng.uniform(2., 4., m),
+                         'length': rng.uniform(100., 400., m),
+                         'slope': rng.uniform(0., 2., m),
+                         'sprinkler_separation': rng.choice([6., 9., 12., 18.], m),
+                         'equation': rng.integers(0, 3, m),
+                         'coefficient': 140.,
+                         'inclination': rng.integers(0, 3, m)})
+
+def bench_lateral(scale):
+    """ Lateral.design_lateral over many fields, one object per field """
+    fields = _fields(size(1000, scale), np.random.default_rng(0))
+    # Manning's n and Scobey's ks instead of Hazen-Williams C
+    fields['coefficient'] = np.choose(fields['equation'], [140., 0.009, 0.4])
+    # Lateral fails for fields that no diameter of the catalog can supply
+    rows = fields[design_laterals(fields)['diameter'].notna()].to_dict('records')
+    def run():
+        for f in rows:
+            lat = Lateral(f['sprinkler_flow'], f['sprinkler_pressure'], 20., f['length'],
+                          f['slope'], f['sprinkler_separation'], 18., True,
+                          f['inclination'], f['equation'], f['coefficient'])
+            lat.design_lateral()
+    return run
+
+def bench_design_laterals(scale):
+    """ design_laterals of 10^5 fields in one batch """
+    fields = _fields(size(1E5, scale), np.random.default_rng(0))
+    fields['coefficient'] = np.choose(fields['equation'], [140., 0.009, 0.4])
+    return lambda: design_laterals(fields)
+
+def bench_scs_storm(scale):
+    """ SCSStorm construction at fine time steps """
+    tstep = 0.01 / scale
+    return lambda: SCSStorm(100., 24, tstep)
+
+def write_fixtures(directory, station_id, years, no_data=999, seed=0):
+    """ Synthetic raw daily and hourly AZMET files, with 1% of the values
+    missing, in the naming of WeatherCache """
+    rng = np.random.default_rng(seed)
+    daily, hourly = len(registry.headers('daily')), len(registry.headers('hourly'))
+    for year in years:
+        days = 366 if pd.Timestamp(year, 12, 31).dayofyear == 366 else 365
+        for dtype, ncols, hours in (('rd', daily, 1), ('rh', hourly, 24)):
+            rows = days * hours
+            values = np.round(rng.uniform(0., 40., (rows, ncols)), 2)
+            values[rng.random((rows, ncols)) < 0.01] = no_data
+            values[:, 0] = year
+            values[:, 1] = np.repeat(np.arange(1, days + 1), hours)
+            if hours > 1:
+                values[:, 2] = np.tile(np.arange(1, 25), days)
+            path = os.path.join(directory, station_id + str(year)[-2:] + dtype + '.txt')
+            fmt = ['%d'] * (3 if hours > 1 else 2) + ['%.2f'] * (ncols - (3 if hours > 1 else 2))
+            np.savetxt(path, values, fmt=fmt, delimiter=',')
+
+class WeatherFixtures:
+    """ Temporary directory with the synthetic files, removed at exit """
+    def __init__(self, scale):
+        self.nyears = size(20, scale)
+        self.years = list(range(2000, 2000 + self.nyears))
+        self.directory = tempfile.mkdtemp(prefix='hydrx_bench_')
+        write_fixtures(self.directory, '01', self.years)
+        self.cache = WeatherCache(self.directory, offline=True)
+
+    def station(self, timestep, cls=WeatherData, *args):
+        ws = cls('Tucson', datetime(self.years[0], 1, 1), timestep, *args)
+        ws.set_end_date(datetime(self.years[-1], 12, 31))
+        ws.set_cache(self.cache)
+        return ws
+
+    def close(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+def bench_weather_daily(fixtures):
+    """ WeatherData parse, trim and fill of multi-year daily files """
+    def run():
+        ws = fixtures.station('daily')
+        ws.get_data()
+        ws.fill_missing()
+    return run
+
+def bench_weather_hourly(fixtures):
+    """ WeatherData parse, trim and fill of multi-year hourly files """
+    def run():
+        ws = fixtures.station('hourly')
+        ws.get_data()
+        ws.fill_missing(max_gap=6)
+    return run
+
+def bench_hourly_to_daily(fixtures):
+    """ Daily values of multi-year hourly data, aggregated in one pass """
+    with contextlib.redirect_stdout(io.StringIO()):
+        ws = fixtures.station('hourly')
+        ws.get_data()
+    return lambda: ws.hourly_to_daily(min_hours=20)
+
+def bench_blaney_criddle(fixtures):
+    """ Blaney-Criddle 'f' for multi-year daily data """
+    def run():
+        bc = fixtures.station('daily', BlanneyCriddle, 32.2, True)
+        bc.get_data(['SR', 'TMean', 'ET0'])
+        bc.fill_missing()
+        bc.add_date()
+        bc.daytime_hours_daily()
+        bc.calculate_f()
+    return run
+
+# Benchmarks of the computations (scale) and of the weather data (fixtures)
+BENCHMARKS = {'manning': bench_manning,
+              'design_channel': bench_design_channel,
+              'normal_depth_batch': bench_normal_depth_batch,
+              'riprap': bench_riprap,
+              'riprap_size': bench_riprap_size,
+              'lateral': bench_lateral,
+              'design_laterals': bench_design_laterals,
+              'scs_storm': bench_scs_storm}
+WEATHER_BENCHMARKS = {'weather_daily': bench_weather_daily,
+                      'weather_hourly': bench_weather_hourly,
+                      'hourly_to_daily': bench_hourly_to_daily,
+                      'blaney_criddle': bench_blaney_criddle}
+
+def import_time(statement, repeat=5):
+    """ Best time to run a statement in a new interpreter, without the
+    startup of the interpreter itself, and the heavy modules it loaded """
+    env = dict(os.environ, PYTHONPATH=SRC)
+    check = '; import sys; print(",".join(m for m in {0} if m in sys.modules))'.format(HEAVY_MODULES)
+    def spawn(code):
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True,
+                             text=True, check=True).stdout
+        return time.perf_counter() - start, out
+    empty = min(spawn('pass')[0] for i in range(repeat))
+    times, loaded = [], ''
+    for i in range(repeat):
+        t, loaded = spawn(statement + check)
+        times.append(t)
+    return max(min(times) - empty, 0.), [m for m in loaded.strip().split(',') if m]
+
+def cold_start(names, budget, repeat=5, disp=True):
+    """ Times the IMPORTS in names, returns the times and the violations of the
+    budget (seconds) or heavy modules loaded by the light imports """
+    results, violations = {}, []
+    for name in names:
+        results[name], loaded = import_time(IMPORTS[name], repeat)
+        light = name in LIGHT_IMPORTS
+        if light and loaded:
+            violations.append('{0} loads {1}'.format(name, ', '.join(loaded)))
+        if light and results[name] > budget:
+            violations.append('{0} takes {1:.3f} s'.format(name, results[name]))
+        if disp:
+            print("{:<20} {:-10.4f} s {}".format(name, results[name],
+                                                 'over budget' if light and results[name] > budget else ''))
+    return results, violations
+
+def best_time(func, repeat):
+    """ Best wall time of several runs, the output of the function is hidden """
+    times = []
+    for i in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+    return min(times)
+
+def run_benchmarks(names, scale=1., repeat=3, disp=True):
+    """ Times the benchmarks, returns a dict of name and best time in seconds """
+    results = {}
+    fixtures = None
+    try:
+        for name in names:
+            if name in BENCHMARKS:
+                func = BENCHMARKS[name](scale)
+            else:
+                if fixtures is None:
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        fixtures = WeatherFixtures(scale)
+                func = WEATHER_BENCHMARKS[name](fixtures)
+            results[name] = best_time(func, repeat)
+            if disp:
+                print("{:<20} {:-10.4f} s".format(name, results[name]))
+    finally:
+        if fixtures is not None:
+            fixtures.close()
+    return results
+
+def git_commit():
+    """ Current commit of the repository, if available """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True, cwd=BENCH_DIR).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+def record(results, scale, repeat, filename=HISTORY_FILE):
+    """ Appends a run to the history file, returns the record """
+    rec = {'date': datetime.now().isoformat(timespec='seconds'),
+           'commit': git_commit(),
+           'python': platform.python_version(),
+           'numpy': np.__version__,
+           'pandas': pd.__version__,
+           'scale': scale,
+           'repeat': repeat,
+           'results': results}
+    with open(filename, 'a') as f:
+        f.write(json.dumps(rec) + '\n')
+    return rec
+
+def compare(results, baseline, tolerance=0.25):
+    """ Ratio to the baseline time of every benchmark in both, and the names
+    of the regressions: ratio above 1 + tolerance """
+    ratios = {name: t / baseline[name] for name, t in results.items()
+              if baseline.get(name, 0) > 0}
+    regressions = [name for name, r in ratios.items() if r > 1. + tolerance]
+    return ratios, regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[2])
+    parser.add_argument('--scale', type=float, default=1., help='multiplier of the sizes')
+    parser.add_argument('--repeat', type=int, default=3, help='repetitions of each benchmark')
+    parser.add_argument('--only', default='', help='comma separated benchmarks to run')
+    parser.add_argument('--history', default=HISTORY_FILE, help='file to append the results')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='file with the baseline')
+    parser.add_argument('--save-baseline', action='store_true', help='save results as baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='slowdown over the baseline flagged as regression')
+    parser.add_argument('--import-budget', type=float, default=0.3,
+                        help='cold start budget (s) of the light imports')
+    args = parser.parse_args(argv)
+
+    available = list(BENCHMARKS) + list(WEATHER_BENCHMARKS) + list(IMPORTS)
+    names = [n for n in args.only.split(',') if n] or available
+    for name in names:
+        assert name in available, "Unknown benchmark '{0}'".format(name)
+
+    print("Benchmarks at scale {0}, best of {1}\n".format(args.scale, args.repeat))
+    results = run_benchmarks([n for n in names if n not in IMPORTS], args.scale, args.repeat)
+    violations = []
+    imports = [n for n in names if n in IMPORTS]
+    if imports:
+        times, violations = cold_start(imports, args.import_budget, max(args.repeat, 3))
+        results.update(times)
+    rec = record(results, args.scale, args.repeat, args.history)
+    for violation in violations:
+        print("COLD START: {0}".format(violation))
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(rec, f, indent=2)
+        print("\nBaseline saved to {0}".format(args.baseline))
+        return 1 if violations else 0
+    if not os.path.exists(args.baseline):
+        print("\nNo baseline to compare, use --save-baseline")
+        return 1 if violations else 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline['scale'] != args.scale:
+        print("\nBaseline scale is {0}, not compared".format(baseline['scale']))
+        return 1 if violations else 0
+
+    ratios, regressions = compare(results, baseline['results'], args.tolerance)
+    print("\nCompared to baseline ({0}, {1})".format(baseline['date'], baseline['commit']))
+    for name, r in ratios.items():
+        print("{:<20} {:-8.2f}x {}".format(name, r, 'REGRESSION' if name in regressions else ''))
+    return 1 if regressions or violations else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
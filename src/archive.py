@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+archive.py
+Local columnar archive of the weather station data
+
+The data is stored in Feather (Apache Arrow) files partitioned by data type,
+station and year: <directory>/<dtype>/<station_id>/<year>.feather
+Only the files of the requested years and only the requested columns are
+read, the files are uncompressed so they can be memory-mapped.
+
+Requires the 'pyarrow' package.
+
+@author: eduardo
+"""
+import os
+import pandas as pd
+import pyarrow.feather as feather
+import registry
+
+class WeatherArchive:
+
+    def __init__(self, directory):
+        """
+        Parameters
+        ----------
+        directory : str
+            Root directory of the archive, created if it does not exist.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+    def __str__(self):
+        text = '\nWEATHER ARCHIVE\n'
+        text += 'Directory:     {0}\n'.format(self.directory)
+        for dtype in sorted(os.listdir(self.directory)):
+            for station_id in sorted(os.listdir(os.path.join(self.directory, dtype))):
+                years = self.years(station_id, dtype)
+                text += 'Station {0} ({1}): {2} years\n'.format(station_id, dtype, len(years))
+        return text
+
+    def path(self, station_id, year, dtype):
+        """ Path of the partition for a station, year and data type """
+        return os.path.join(self.directory, dtype, station_id, str(year) + '.feather')
+
+    def years(self, station_id, dtype):
+        """ List of the years archived for a station and data type """
+        folder = os.path.join(self.directory, dtype, station_id)
+        if not os.path.isdir(folder):
+            return []
+        return sorted(int(f.split('.')[0]) for f in os.listdir(folder) if f.endswith('.feather'))
+
+    def has_year(self, station_id, year, dtype):
+        """ True if the year is archived for the station and data type """
+        return os.path.exists(self.path(station_id, year, dtype))
+
+    def write_year(self, station_id, year, dtype, data):
+        """ Saves the Data Frame of a single year as a partition """
+        filename = self.path(station_id, year, dtype)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        # Uncompressed files can be memory-mapped when reading
+        feather.write_feather(data.reset_index(drop=True), filename + '.part',
+                              compression='uncompressed')
+        os.replace(filename + '.part', filename)
+
+    def write(self, station_id, dtype, data, year_col='Year'):
+        """ Saves a Data Frame with several years, one partition per year """
+        for year, annual in data.groupby(year_col):
+            self.write_year(station_id, year, dtype, annual)
+
+    def read_year(self, station_id, year, dtype, columns=None):
+        """ Reads the requested columns of a single year, memory-mapped """
+        table = feather.read_table(self.path(station_id, year, dtype),
+                                   columns=columns, memory_map=True)
+        return table.to_pandas()
+
+    def read(self, station_id, dtype, start_date, end_date, columns=None,
+             year_col=None, doy_col=None):
+        """
+        Reads the archived data between two dates.
+
+        Parameters
+        ----------
+        station_id : str
+            Two-digit ID of the weather station.
+        dtype : str
+            Data type, 'rd' raw daily or 'rh' raw hourly.
+        start_date : date
+            First date to read.
+        end_date : date
+            Dates before this one are read, as in WeatherData.trim_data.
+        columns : list, optional
+            Columns to read. The default is None, all the columns.
+        year_col, doy_col : str, optional
+            Columns of the year and day of year used to select the dates. The
+            default is None, the first two columns of the raw files of the
+            data type, e.g. 'Year' and 'Day of Year (DOY)' for hourly data.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The data of the archived years in the period.
+
+        """
+        headers = registry.headers('daily' if dtype == 'rd' else 'hourly')
+        year_col = headers[0] if year_col is None else year_col
+        doy_col = headers[1] if doy_col is None else doy_col
+        cols = None
+        if columns is not None:
+            # Year and DOY are needed to select the dates
+            cols = list(dict.fromkeys([year_col, doy_col] + list(columns)))
+        years = [y for y in self.years(station_id, dtype)
+                 if start_date.year <= y <= end_date.year]
+        if len(years) == 0:
+            return pd.DataFrame(columns=None if columns is None else list(columns))
+        data = pd.concat([self.read_year(station_id, y, dtype, cols) for y in years],
+                         ignore_index=True)
+        start_doy = start_date.timetuple().tm_yday
+        end_doy = end_date.timetuple().tm_yday
+        year, doy = data[year_col], data[doy_col]
+        keep = ~(((year == start_date.year) & (doy < start_doy)) |
+                 ((year == end_date.year) & (doy >= end_doy)))
+        data = data[keep].reset_index(drop=True)
+        return data if columns is None else data[list(columns)]
+
+
+if __name__ == "__main__":
+    # Test with synthetic daily and hourly data of two years
+    import tempfile
+    import numpy as np
+    from datetime import date
+
+    archive = WeatherArchive(tempfile.mkdtemp())
+    daily, hourly = registry.headers('daily'), registry.headers('hourly')
+    doy = np.arange(1, 366)
+    rd = pd.DataFrame({daily[0]: np.repeat([2019, 2020], 365), daily[1]: np.tile(doy, 2),
+                       daily[3]: np.arange(730.)})
+    rh = pd.DataFrame({hourly[0]: np.repeat([2019, 2020], 365 * 24),
+                       hourly[1]: np.tile(np.repeat(doy, 24), 2),
+                       hourly[2]: np.tile(np.arange(1, 25), 730),
+                       hourly[3]: np.arange(730. * 24)})
+    archive.write('01', 'rd', rd, year_col=daily[0])
+    archive.write('01', 'rh', rh, year_col=hourly[0])
+    print(archive)
+
+    start, end = date(2019, 12, 1), date(2020, 2, 1)
+    tmax = archive.read('01', 'rd', start, end, columns=[daily[3]])
+    assert list(tmax.columns) == [daily[3]] and len(tmax) == 62, "Wrong daily period"
+    temp = archive.read('01', 'rh', start, end, columns=[hourly[3]])
+    assert list(temp.columns) == [hourly[3]] and len(temp) == 62 * 24, "Wrong hourly period"
+    assert len(archive.read('01', 'rh', start, end).columns) == 4, "Missing hourly columns"
+    empty = archive.read('01', 'rh', date(2010, 1, 1), date(2011, 1, 1), columns=[hourly[3]])
+    assert list(empty.columns) == [hourly[3]] and len(empty) == 0, "Wrong empty period"
+    print(temp.head())
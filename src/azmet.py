@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+azmet.py
+Parser for the raw daily ('rd') and raw hourly ('rh') AZMET text files
+
+The files are comma delimited without header. Year and day of year are read
+as 16-bit integers, the hour as 8-bit integer and the measurements as 32-bit
+floats. The NO_DATA values (999) are read as NaN and the rows outside of the
+requested dates are dropped while the file is read by chunks.
+
+@author: eduardo
+"""
+import numpy as np
+import pandas as pd
+
+NO_DATA = 999
+
+def schema(headers):
+    """ Compact data types for the columns of a raw daily or hourly file
+    The first columns are year and day of year, and the hour for hourly data """
+    dtypes = {header: 'float32' for header in headers}
+    dtypes[headers[0]] = 'int16'  # Year
+    dtypes[headers[1]] = 'int16'  # Day of year
+    if headers[2].startswith('Hour'):
+        dtypes[headers[2]] = 'int8'  # Hour of day
+    return dtypes
+
+def datetime_index(year, doy, hour=None, tz=None):
+    """
+    Dates (or date and time) of the rows of a raw file, built at once from
+    the year, day of year and hour columns.
+
+    The hours of AZMET are 1 to 24 and each value is for the hour ending at
+    that time, so hour 24 is the midnight that ends the day. The times are
+    local standard time all the year (Arizona does not observe daylight
+    saving time), so they never fall in a skipped or repeated hour.
+
+    Parameters
+    ----------
+    year, doy : array_like
+        Year and day of year of every row.
+    hour : array_like, optional
+        Hour of day, 1 to 24. The default is None, daily data.
+    tz : str, optional
+        Time zone of the times, e.g. 'America/Phoenix' or 'Etc/GMT+7' (MST).
+        The default is None, naive local times.
+
+    Returns
+    -------
+    pandas.DatetimeIndex
+        The dates, or the end of the hour for hourly data.
+
+    """
+    year = np.asarray(year, dtype='int64')
+    doy = np.asarray(doy, dtype='int64')
+    t = (year - 1970).astype('datetime64[Y]').astype('datetime64[D]') + \
+        (doy - 1).astype('timedelta64[D]')
+    t = t.astype('datetime64[s]')
+    if hour is not None:
+        t = t + np.asarray(hour, dtype='int64').astype('timedelta64[h]')
+    index = pd.DatetimeIndex(t)
+    return index if tz is None else index.tz_localize(tz)
+
+def read_raw(source, headers, selection=None, **kwargs):
+    """
+    Reads a raw AZMET file into a Data Frame with compact data types.
+
+    Parameters
+    ----------
+    source : str or file-like
+        Path, URL or buffer of the raw daily or hourly file.
+    headers : list
+        Column names of the file.
+    selection : list, optional
+        Columns to read. The default is None, all the columns.
+    start_date : date, optional
+        Rows before this date are dropped.
+    end_date : date, optional
+        Rows from this date are dropped, as in WeatherData.trim_data.
+    chunksize : int, optional
+        Number of rows read at a time. The default is 50000.
+    no_data : float, optional
+        Value used for missing data, read as NaN. The default is 999.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The data, only with the columns in the selection.
+
+    """
+    _start = kwargs.get('start_date', None)
+    _end = kwargs.get('end_date', None)
+    _chunksize = kwargs.get('chunksize', 50000)
+    _no_data = kwargs.get('no_data', NO_DATA)
+
+    headers = list(headers)
+    year, doy = headers[0], headers[1]
+    dtypes = schema(headers)
+    columns = headers
+    if selection is not None:
+        for header in selection:
+            assert header in headers, "Header '{0}' is not a column name".format(header)
+        # Year and day of year are always read to filter the dates
+        columns = list(dict.fromkeys([year, doy] + list(selection)))
+    # Missing data only in float columns, integer columns cannot hold NaN
+    na_values = {h: [_no_data] for h in columns if dtypes[h] == 'float32'}
+
+    # Dates as a single number, e.g. 2004032 for Feb 1, 2004
+    first = _start.year * 1000 + _start.timetuple().tm_yday if _start else None
+    last = _end.year * 1000 + _end.timetuple().tm_yday if _end else None
+
+    chunks = []
+    reader = pd.read_csv(source, names=headers, usecols=columns,
+                         dtype={h: dtypes[h] for h in columns},
+                         na_values=na_values, keep_default_na=False,
+                         chunksize=_chunksize)
+    for chunk in reader:
+        if first is not None or last is not None:
+            key = chunk[year].astype('int32') * 1000 + chunk[doy]
+            keep = pd.Series(True, index=chunk.index)
+            if first is not None:
+                keep &= key >= first
+            if last is not None:
+                keep &= key < last
+            chunk = chunk[keep]
+        chunks.append(chunk)
+    data = pd.concat(chunks, ignore_index=True) if chunks else \
+        pd.DataFrame({h: pd.Series(dtype=dtypes[h]) for h in columns})
+    return data[columns if selection is None else list(selection)]
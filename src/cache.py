@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+cache.py
+Local on-disk cache for the annual files of the automatic weather stations
+
+Files are stored with the same name used by AZMET (station, year and data
+type, e.g. 0118rd.txt). Files of past years are complete and never expire,
+the file of the current year is downloaded again when it gets old. The size
+of the cache is limited and the least recently used files are removed first.
+
+@author: eduardo
+"""
+import os
+import time
+import threading
+from datetime import datetime
+
+class WeatherCache:
+
+    def __init__(self, directory, max_size=500E6, max_age=86400, offline=False):
+        """
+        Parameters
+        ----------
+        directory : str
+            Directory to save the cached files, created if it does not exist.
+        max_size : float, optional
+            Maximum size of the cache in bytes. The default is 500 MB.
+        max_age : float, optional
+            Age in seconds after which the file of the current year is
+            downloaded again. The default is 86400 (one day).
+        offline : bool, optional
+            True to use only the cached files, without downloading.
+            The default is False.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.max_age = max_age
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()  # files can be retrieved by several threads
+        os.makedirs(self.directory, exist_ok=True)
+
+    def __str__(self):
+        text = '\nWEATHER CACHE\n'
+        text += 'Directory:     {0}\n'.format(self.directory)
+        text += 'Files:         {0}\n'.format(len(self.files()))
+        text += 'Size:          {0} [bytes]\n'.format(self.size())
+        text += 'Hits:          {0}\n'.format(self.hits)
+        text += 'Misses:        {0}\n'.format(self.misses)
+        return text
+
+    def path(self, station_id, year, dtype):
+        """ Path of the cached file for a station, year and data type """
+        return os.path.join(self.directory, station_id + str(year)[-2:] + dtype + '.txt')
+
+    def files(self):
+        """ List of the paths of all the cached files """
+        return [os.path.join(self.directory, f) for f in os.listdir(self.directory)
+                if f.endswith('.txt')]
+
+    def size(self):
+        """ Total size of the cached files in bytes """
+        return sum(os.path.getsize(f) for f in self.files())
+
+    def is_fresh(self, filename, year):
+        """ Past years never expire, the current year expires after max_age """
+        if not os.path.exists(filename):
+            return False
+        if int(year) < datetime.today().year:
+            return True
+        return (time.time() - os.path.getmtime(filename)) < self.max_age
+
+    def get(self, station_id, year, dtype, url, download):
+        """ Returns the path of the cached file, downloading it if needed
+
+        url: str, the URL of the file
+        download: callable, download(url) returns the content as bytes
+        """
+        filename = self.path(station_id, year, dtype)
+        with self.lock:
+            if self.is_fresh(filename, year) or (self.offline and os.path.exists(filename)):
+                self.hits += 1
+                # Update the access time to keep track of the least recently used
+                os.utime(filename, (time.time(), os.path.getmtime(filename)))
+                return filename
+            if self.offline:
+                raise FileNotFoundError('File {0} is not in the cache (offline mode)'.format(filename))
+            self.misses += 1
+        content = download(url)
+        with self.lock:
+            # Write to a temporary file first, so an interrupted download is not cached
+            with open(filename + '.part', 'wb') as f:
+                f.write(content)
+            os.replace(filename + '.part', filename)
+            self.evict(keep=filename)
+        return filename
+
+    def evict(self, keep=None):
+        """ Removes the least recently used files until the size limit is met """
+        files = sorted(self.files(), key=os.path.getatime)
+        total = sum(os.path.getsize(f) for f in files)
+        for f in files:
+            if total <= self.max_size:
+                break
+            if f == keep:
+                continue
+            total -= os.path.getsize(f)
+            os.remove(f)
+
+    def clear(self):
+        """ Removes all the cached files """
+        for f in self.files():
+            os.remove(f)
+
+if __name__ == '__main__':
+    # Test the cache with a local server that stands in for AZMET
+    import tempfile
+    import urllib.request
+    from collections import Counter
+    from functools import partial
+    from http.server import HTTPServer, SimpleHTTPRequestHandler
+
+    served = tempfile.mkdtemp()
+    for yr in range(10, 20):
+        with open(os.path.join(served, '01' + str(yr) + 'rd.txt'), 'w') as f:
+            f.write('20{0},1,1,20.5,10.2\n'.format(yr) * 200)
+    class QuietHandler(SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+    handler = partial(QuietHandler, directory=served)
+    server = HTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = 'http://127.0.0.1:{0}/'.format(server.server_port)
+
+    downloads = Counter()  # number of downloads of every URL
+    def download(url):
+        downloads[url] += 1
+        return urllib.request.urlopen(url).read()
+    cache = WeatherCache(tempfile.mkdtemp(), max_size=8 * 3800)
+    for first in (2010, 2012):
+        # Second run gets the 8 most recently used files from the cache
+        for year in range(first, 2020):
+            url = base_url + '01' + str(year)[-2:] + 'rd.txt'
+            cache.get('01', year, 'rd', url, download)
+        print(cache)
+    server.shutdown()
+    assert (cache.hits, cache.misses) == (8, 10), "Unexpected cache hits or misses"
+    assert len(downloads) == 10 and set(downloads.values()) == {1}, "Files downloaded twice"
+    assert len(cache.files()) == 8, "Cache over its size limit"
+
+    # Offline mode serves only the files already in the cache
+    cache.offline = True
+    print(cache.get('01', 2019, 'rd', '', download))
+    assert cache.hits == 9 and sum(downloads.values()) == 10, "Offline mode downloaded a file"
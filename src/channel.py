@@ -5,7 +5,14 @@ Open channel design
 Created on Mon Oct 19 11:26:35 2020
 @author: 0x1A3
 """
-from manning import manning, Triangular, Trapezoidal, Rectangular
+import time
+import warnings
+import numpy as np
+from manning import manningQ, Triangular, Trapezoidal, Rectangular
+from solvers import expand_bracket, find_root, Trace
+
+# Values recorded by a trace of design_channel, one row per iteration
+CHANNEL_FIELDS = ['i', 'y', 'A', 'R', 'v', 'Q', 'diff']
 
 def print_iter(it):
     print("{:8} {:-8.4f} {:-8.4f} {:-8.4f} {:-8.4f} {:-8.4f} {:-8.4f} {:^8}".format(
@@ -18,12 +25,123 @@ def print_iter(it):
         it.get('d'),
         it.get('ok')))
 
+def normal_depth(n, S, Qdes, section, SI=True, **kwargs):
+    """
+    Normal depth of a channel section using Manning's equation and a
+    bracketed root finder. Section parameters and n, S, Qdes can be arrays,
+    then the normal depth of every row is solved at once.
+
+    Parameters
+    ----------
+    n : float or array_like
+        Manning roughness coefficient.
+    S : float or array_like
+        Channel slope (m/m or ft/ft).
+    Qdes : float or array_like
+        Design discharge (cms or cfs).
+    section : object
+        A cross section from manning.py with setDepth, e.g. Trapezoidal.
+    SI : boolean, optional
+        True for SI units, False for US customary units. The default is True.
+    y : float, optional
+        Initial guess of the upper limit of the depth. The default is 1.
+    tol : float, optional
+        Tolerance on the discharge |Qdes - Q|. The default is 0.
+    xtol : float, optional
+        Tolerance on the depth. The default is 1E-10.
+    max_iter : int, optional
+        Maximum number of iterations. The default is 100.
+    callback : callable, optional
+        Called for the initial depth (i = 0) and after every iteration as
+        callback(i, y, Q - Qdes, state), state is a dict with the area 'A',
+        hydraulic radius 'R' and discharge 'Q' evaluated by the solver at y.
+
+    Returns
+    -------
+    y : float or ndarray
+        The normal depth.
+    info : dict
+        Convergence diagnostics, see solvers.find_root.
+
+    """
+    _y0 = kwargs.get('y', 1.)
+    _callback = kwargs.get('callback', None)
+    Qdes = np.asarray(Qdes, dtype=float)
+    state = {}  # values of the last evaluation
+
+    def discharge_diff(y):
+        section.setDepth(y)
+        A, R = section.getArea(), section.getHydraulicRadius()
+        state['A'], state['R'], state['Q'] = A, R, manningQ(n, A, R, S, SI)
+        return state['Q'] - Qdes
+
+    def report(i, y, diff):
+        # The last evaluation of the solver is at the current root estimate
+        _callback(i, y, diff, state)
+
+    fb = discharge_diff(np.asarray(_y0, dtype=float))
+    if _callback is not None:
+        _callback(0, _y0, fb, state)
+    # Q(0) = 0 and Q(y) increases with depth, enlarge y until Q >= Qdes
+    a, b, fa, fb, evals = expand_bracket(discharge_diff, 0., _y0, fa=-Qdes, fb=fb)
+    y, info = find_root(discharge_diff, a, b, fa, fb,
+                        xtol=kwargs.get('xtol', 1E-10),
+                        ftol=kwargs.get('tol', 0.),
+                        max_iter=kwargs.get('max_iter', 100),
+                        callback=report if _callback is not None else None)
+    info['evaluations'] += evals + 1
+    section.setDepth(y)
+    return y, info
+
+def normal_depth_batch(n, S, Qdes, base=0., z=0., SI=True, **kwargs):
+    """
+    Normal depth for many channels at once. Every row is a trapezoidal
+    section, rows with base = 0 are triangular and rows with z = 0 are
+    rectangular channels.
+
+    Parameters
+    ----------
+    n, S, Qdes : array_like
+        Manning roughness, slope and design discharge of each channel.
+    base : array_like, optional
+        Base width of each channel. The default is 0.
+    z : array_like, optional
+        Side slope 1:z (rise:run) of each channel. The default is 0.
+    SI : boolean, optional
+        True for SI units, False for US customary units. The default is True.
+    **kwargs
+        Solver options, see normal_depth.
+
+    Returns
+    -------
+    y : ndarray
+        The normal depth of each channel.
+    info : dict
+        Convergence diagnostics, see solvers.find_root.
+
+    """
+    B, z = np.broadcast_arrays(np.asarray(base, dtype=float),
+                               np.asarray(z, dtype=float))
+    assert np.all((B > 0) | (z > 0)), "Cannot design channel, base or z should be positive"
+    section = Trapezoidal(B, z, 1.)
+    return normal_depth(n, S, Qdes, section, SI, **kwargs)
+
 def design_channel(n, S, Qdes, **kwargs):
+    """ Normal depth of a single channel, returns the depth
+    disp: int, optional, print every disp iterations, default 0 (quiet)
+    trace: Trace, optional, records the iterations (CHANNEL_FIELDS) and the
+        counters of iterations, evaluations and wall time
+    y: float, optional, initial depth, default 0.01
+    max_iter: int, optional, maximum iterations, default 1E5
+    inc: deprecated, the depth is no longer searched by increments """
     
-    _disp = kwargs.get('disp', 1)  # display iterations
+    _disp = kwargs.get('disp', 0)  # display iterations
+    _trace = kwargs.get('trace', None)  # record iterations
     _tol = kwargs.get('tol', 1E-2)  # tolerance of solution
-    _inc = kwargs.get('inc', 1E-2)  # increment
     _max_iter = kwargs.get('max_iter', 1E5)  # maximum iterations
+    if 'inc' in kwargs:
+        warnings.warn("'inc' is deprecated and ignored, design_channel finds the depth "
+                      "with a bracketed root finder", DeprecationWarning, stacklevel=2)
     
     B = kwargs.get('base', 0)
     z = kwargs.get('z', 0)
@@ -44,78 +162,145 @@ def design_channel(n, S, Qdes, **kwargs):
         print("Cannot design channel")
         return None
     
-    iteration = {}
-    saved_iter = {}
+    def show(i, y, diff, state):
+        # Record and print the iterations rows with the solver's own values
+        shown = _disp and (i % _disp) == 0
+        if not shown and _trace is None:
+            return
+        y, diff = float(np.squeeze(y)), float(np.squeeze(diff))
+        A, R, Q = [float(np.squeeze(state[k])) for k in ('A', 'R', 'Q')]
+        v = Q / A
+        if _trace is not None:
+            _trace.record(i, y, A, R, v, Q, -diff)
+        if shown:
+            print_iter({'i': i, 'y': y, 'A': A, 'R': R, 'v': v, 'Q': Q,
+                        'd': -diff, 'ok': str(abs(diff) < _tol)})
     
-    # First iteration
-    A = section.getArea()
-    R = section.getHydraulicRadius()
-    v = manning(n, R, S, SI)
-    Q = A * v
-    diff = Qdes - Q
-    prev_diff = Qdes - Q
-    accept = str(abs(diff) < _tol)
+    if _disp:
+        print("\nSearching water depth by iterations\n")
+        print("Iter        y        A        R        v        Q       Diff   Accept?")
     
-    c_iter = 0  # Initialize the current iteration
-    
-    iteration['i'] = c_iter
-    iteration['y'] = y
-    iteration['A'] = A
-    iteration['R'] = R
-    iteration['v'] = v
-    iteration['Q'] = Q
-    iteration['d'] = diff
-    iteration['ok'] = accept
-    
-    print("\nSearching water depth by iterations\n")
-    print("Iter        y        A        R        v        Q       Diff   Accept?")
-    print_iter(iteration)
-
-    # Iterate to find the channel depth
-    while (accept != True and c_iter < _max_iter):
-        y += _inc
-        c_iter += 1
-        
-        # Save the previous iteration
-        saved_iter = iteration
-        
-        # Calculate values of current iteration
-        section.setDepth(y)
-        A = section.getArea()
-        R = section.getHydraulicRadius()
-        v = manning(n, R, S, SI)
-        Q = A * v
-        diff = Qdes - Q
-        accept = abs(diff) < _tol
-        
-        # Update current iteration
-        iteration['i'] = c_iter
-        iteration['y'] = y
-        iteration['A'] = A
-        iteration['R'] = R
-        iteration['v'] = v
-        iteration['Q'] = Q
-        iteration['d'] = diff
-        iteration['ok'] = accept
-        
-        # Print the iterations rows
-        if (c_iter % _disp) == 0:
-            print_iter(iteration)
-            
-        
-        if (saved_iter['d'] > 0) and (iteration['d'] < 0):
-            save = False
-        # # Solution not found for the level of tolerance
-        # if (prev_diff > 0) and (diff < 0):
-        #     print("Warning: solution not found for this tolerance. Best approximation is given.")
-        #     break
-        # else:
-            # This will save the current iteration, we need to save the previous
-        #     saved_iter = iteration
-        # prev_diff = diff
+    # Find the depth with a bracketed root finder on Manning's Q(y)
+    start = time.perf_counter()
+    y, info = normal_depth(n, S, Qdes, section, SI, y=y, tol=_tol, max_iter=_max_iter,
+                           callback=show if (_disp or _trace is not None) else None)
+    if _trace is not None:
+        _trace.iterations += info['iterations']
+        _trace.evaluations += info['evaluations']
+        _trace.elapsed += time.perf_counter() - start
+    if not info['converged']:
+        warnings.warn("Solution not found for this tolerance. Best approximation is given.",
+                      RuntimeWarning, stacklevel=2)
 
     return y
 
+def optimal_channel(n, S, Qdes, **kwargs):
+    """
+    Least cost trapezoidal channel for a design discharge. A grid of base
+    widths and side slopes is evaluated at once (the depth of every
+    candidate is its normal depth), the constraints are applied and the
+    grid is refined around the cheapest feasible candidate.
+
+    Parameters
+    ----------
+    n : float
+        Manning roughness coefficient.
+    S : float
+        Channel slope (m/m or ft/ft).
+    Qdes : float
+        Design discharge (cms or cfs).
+    base : array_like, optional
+        Base widths of the initial grid. The default is 20 values, 0 to 10.
+    z : array_like, optional
+        Side slopes 1:z of the initial grid. The default is 13 values, 0 to 3.
+    refine : int, optional
+        Number of refinements of the grid. The default is 3.
+    freeboard : float, optional
+        Freeboard as a fraction of the depth. The default is 0.2.
+    min_freeboard : float, optional
+        Minimum freeboard. The default is 0.
+    v_min, v_max : float, optional
+        Permissible velocities, e.g. to avoid sedimentation and erosion.
+        The defaults are 0 and no limit.
+    froude : tuple, optional
+        Range of the Froude number. The default is (0, 0.8), subcritical.
+    top_width : float, optional
+        Maximum top width including the freeboard. The default is no limit.
+    excavation_cost : float, optional
+        Cost of excavation per unit volume. The default is 1.
+    lining_cost : float, optional
+        Cost of lining per unit area, lined perimeter includes the freeboard.
+        The default is 0.
+    SI : boolean, optional
+        True for SI units, False for US customary units. The default is True.
+
+    Returns
+    -------
+    best : dict
+        The cheapest design: 'base', 'z', 'y', 'freeboard', 'velocity',
+        'froude', 'top_width' and 'cost' per unit length. None if no
+        candidate meets the constraints.
+    candidates : dict
+        The same keys for all the feasible candidates of the last grid,
+        sorted by cost, to compare alternatives.
+
+    """
+    _B = np.asarray(kwargs.get('base', np.linspace(0., 10., 20)), dtype=float)
+    _z = np.asarray(kwargs.get('z', np.linspace(0., 3., 13)), dtype=float)
+    _refine = kwargs.get('refine', 3)
+    _fb = kwargs.get('freeboard', 0.2)
+    _fb_min = kwargs.get('min_freeboard', 0.)
+    _v_min = kwargs.get('v_min', 0.)
+    _v_max = kwargs.get('v_max', np.inf)
+    _fr_min, _fr_max = kwargs.get('froude', (0., 0.8))
+    _T_max = kwargs.get('top_width', np.inf)
+    _c_exc = kwargs.get('excavation_cost', 1.)
+    _c_lin = kwargs.get('lining_cost', 0.)
+    SI = kwargs.get('SI', True)
+    g = 9.81 if SI else 32.2
+
+    def evaluate(B, z):
+        # All the combinations of the grid, except B = z = 0
+        B, z = [x.ravel() for x in np.meshgrid(B, z, indexing='ij')]
+        keep = (B > 0) | (z > 0)
+        B, z = B[keep], z[keep]
+        y, info = normal_depth_batch(n, S, Qdes, B, z, SI)
+        section = Trapezoidal(B, z, y)
+        A, T = section.getArea(), section.getTopWidth()
+        v = Qdes / A
+        Fr = v / np.sqrt(g * A / T)
+        # Total depth and section with the freeboard
+        fb = np.maximum(_fb * y, _fb_min)
+        H = y + fb
+        section.setDepth(H)
+        T_total = section.getTopWidth()
+        cost = _c_exc * section.getArea() + \
+            _c_lin * (B + 2. * H * np.sqrt(1. + z * z))
+        ok = info['converged'] & (v >= _v_min) & (v <= _v_max) & \
+            (Fr >= _fr_min) & (Fr <= _fr_max) & (T_total <= _T_max)
+        order = np.argsort(np.where(ok, cost, np.inf))[:ok.sum()]
+        return {'base': B[order], 'z': z[order], 'y': y[order], 'freeboard': fb[order],
+                'velocity': v[order], 'froude': Fr[order], 'top_width': T_total[order],
+                'cost': cost[order]}
+
+    candidates = evaluate(_B, _z)
+    for i in range(_refine):
+        if not len(candidates['cost']):
+            break
+        # New grid between the neighbours of the best candidate
+        B0, z0 = candidates['base'][0], candidates['z'][0]
+        dB = np.ptp(_B) / max(len(_B) - 1, 1)
+        dz = np.ptp(_z) / max(len(_z) - 1, 1)
+        _B = np.linspace(max(B0 - dB, 0.), B0 + dB, len(_B)) if dB > 0 else _B
+        _z = np.linspace(max(z0 - dz, 0.), z0 + dz, len(_z)) if dz > 0 else _z
+        refined = evaluate(_B, _z)
+        if len(refined['cost']) and refined['cost'][0] <= candidates['cost'][0]:
+            candidates = refined
+    if not len(candidates['cost']):
+        return None, candidates
+    best = {k: v[0] for k, v in candidates.items()}
+    return best, candidates
+
 if __name__ == "__main__":
     # Problem 4.3 from textbook (homework) 
     Qdes = 30
@@ -123,7 +308,7 @@ if __name__ == "__main__":
     n = 0.025
     side_slope = 1
     
-    ans = design_channel(n, S, Qdes, z=side_slope, SI=False, tol=0.1)
+    ans = design_channel(n, S, Qdes, z=side_slope, SI=False, tol=0.1, disp=1)
     
     # Design erodible channel
     # Example 4.10 from textbook
@@ -136,4 +321,23 @@ if __name__ == "__main__":
     # vp = 3.5
     
     # ans = design_channel(n, S, Q, z=z, base=B, SI=False)
-    print("\nSOLUTION:\nThe channel depth is: {:-8.4f}".format(ans))
\ No newline at end of file
+    print("\nSOLUTION:\nThe channel depth is: {:-8.4f}".format(ans))
+
+    # Quiet run, the iterations are kept in a trace
+    trace = Trace(CHANNEL_FIELDS)
+    design_channel(n, S, Qdes, z=side_slope, SI=False, tol=0.1, trace=trace)
+    print(trace)
+    trace.show()
+    
+    # Normal depth of many channels at once
+    Qs = np.linspace(5, 50, 10)
+    depths, info = normal_depth_batch(n, S, Qs, base=2., z=side_slope, SI=False)
+    print("\nNormal depths: {0}".format(np.round(depths, 4)))
+    print("Iterations: {0}, evaluations: {1}".format(info['iterations'], info['evaluations']))
+    # Least cost lined channel with permissible velocity and top width
+    best, candidates = optimal_channel(n, S, Qdes, v_max=8., top_width=15.,
+                                       excavation_cost=8., lining_cost=25.,
+                                       base=np.linspace(0., 20., 21), SI=False)
+    print("\nLeast cost channel (of {0} feasible alternatives):".format(len(candidates['cost'])))
+    for key, value in best.items():
+        print("{:<10} {:-10.4f}".format(key, value))
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+gvf.py
+Water surface profiles of gradually varied flow by the standard step method
+
+The energy equation between consecutive stations of a reach is solved with
+the secant method. The properties of each cross section are taken from
+precomputed hydraulic tables and many discharges are computed at once.
+
+@author: eduardo
+"""
+import numpy as np
+from tables import get_table
+
+class StandardStep:
+
+    def __init__(self, stations, elevations, sections, n, depth_max, SI=True, **kwargs):
+        """
+        Parameters
+        ----------
+        stations : array_like
+            Distance of the stations along the reach, increasing upstream.
+        elevations : array_like
+            Bed elevation at each station.
+        sections : object or list
+            A cross section from manning.py with setDepth for all the
+            stations, or one section per station.
+        n : float or array_like
+            Manning roughness coefficient, one value or one per station.
+            Not used for sections with their own roughness zones, e.g. a
+            NaturalSection created with n.
+        depth_max : float
+            Maximum depth of the hydraulic tables.
+        SI : boolean, optional
+            True for SI units, False for US customary units. The default is True.
+        alpha : float, optional
+            Kinetic energy correction coefficient. The default is 1.
+        npoints : int, optional
+            Number of depths of the hydraulic tables. The default is 500.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.stations = np.asarray(stations, dtype=float)
+        self.elevations = np.asarray(elevations, dtype=float)
+        assert self.stations.shape == self.elevations.shape, 'One elevation per station is needed'
+        assert np.all(np.diff(self.stations) > 0), 'Stations should increase upstream'
+        N = len(self.stations)
+        if not isinstance(sections, (list, tuple)):
+            sections = [sections] * N
+        n = np.broadcast_to(np.asarray(n, dtype=float), (N,))
+        assert len(sections) == N, 'One section per station is needed'
+
+        self.SI = SI
+        self.g = 9.81 if SI else 32.2
+        self.alpha = kwargs.get('alpha', 1.)
+        self.depth_max = depth_max
+        _npoints = kwargs.get('npoints', 500)
+
+        # One table for each different section and roughness
+        self.tables = [get_table(section, depth_max, ni, SI, _npoints)
+                       for section, ni in zip(sections, n)]
+
+    def energy(self, i, y, Q):
+        """ Total head and friction slope at station i for depths y """
+        table = self.tables[i]
+        A = table.get('area', y)
+        K = table.get('conveyance', y)
+        V = Q / A
+        H = self.elevations[i] + y + self.alpha * V * V / (2. * self.g)
+        return H, (Q / K)**2
+
+    def profile(self, Q, y_control, subcritical=True, **kwargs):
+        """
+        Computes the water surface profile for one or many discharges.
+
+        Parameters
+        ----------
+        Q : float or array_like
+            Discharges.
+        y_control : float or array_like
+            Depth at the control section: the most downstream station for
+            subcritical flow, the most upstream station for supercritical.
+        subcritical : boolean, optional
+            True to compute upstream (subcritical flow), False to compute
+            downstream (supercritical flow). The default is True.
+        tol : float, optional
+            Tolerance of the depth. The default is 1E-6.
+        max_iter : int, optional
+            Maximum secant iterations per step. The default is 50.
+
+        Returns
+        -------
+        depth : ndarray
+            Depths with shape (stations, discharges).
+        info : dict
+            Arrays with shape (stations, discharges): 'wse' water surface
+            elevation, 'velocity', 'froude' and 'converged'; and the total
+            number of secant 'iterations'.
+
+        """
+        _tol = kwargs.get('tol', 1E-6)
+        _max_iter = kwargs.get('max_iter', 50)
+        Q, y0 = np.broadcast_arrays(np.atleast_1d(np.asarray(Q, dtype=float)),
+                                    np.asarray(y_control, dtype=float))
+        N = len(self.stations)
+        depth = np.empty((N, len(Q)))
+        converged = np.ones((N, len(Q)), dtype=bool)
+        order = list(range(N)) if subcritical else list(range(N - 1, -1, -1))
+        sign = 1. if subcritical else -1.
+        ymin = self.depth_max * 1E-6
+        depth[order[0]] = y0
+        iterations = 0
+
+        for j, i in zip(order[:-1], order[1:]):
+            # Energy at the known station j
+            H1, Sf1 = self.energy(j, depth[j], Q)
+            L = abs(self.stations[i] - self.stations[j])
+
+            def f(y):
+                H2, Sf2 = self.energy(i, y, Q)
+                return H2 - H1 - sign * L * 0.5 * (Sf1 + Sf2)
+
+            # Start with the same water surface elevation for subcritical
+            # flow and the same depth for supercritical, then secant steps
+            if subcritical:
+                ya = np.clip(depth[j] + self.elevations[j] - self.elevations[i], ymin, self.depth_max)
+                yb = np.clip(ya * 1.01 + 1E-3, ymin, self.depth_max)
+            else:
+                ya = depth[j]
+                yb = np.clip(ya * 0.99, ymin, self.depth_max)
+            fa, fb = f(ya), f(yb)
+            done = np.abs(yb - ya) < _tol
+            k = 0
+            while not done.all() and k < _max_iter:
+                k += 1
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    yc = yb - fb * (yb - ya) / (fb - fa)
+                yc = np.where(np.isfinite(yc), yc, 0.5 * (ya + yb))
+                yc = np.clip(yc, ymin, self.depth_max)
+                ya, fa = np.where(done, ya, yb), np.where(done, fa, fb)
+                yb = np.where(done, yb, yc)
+                fb = np.where(done, fb, f(yb))
+                done = done | (np.abs(yb - ya) < _tol)
+            iterations += k
+            depth[i] = yb
+            converged[i] = done & (yb < self.depth_max) & (yb > ymin)
+
+        A = np.array([self.tables[i].get('area', depth[i]) for i in range(N)])
+        T = np.array([self.tables[i].get('top_width', depth[i]) for i in range(N)])
+        V = Q / A
+        info = {'wse': self.elevations[:, None] + depth,
+                'velocity': V,
+                'froude': V / np.sqrt(self.g * A / T),
+                'converged': converged,
+                'iterations': iterations}
+        return depth, info
+
+if __name__ == "__main__":
+    from manning import Trapezoidal
+    from channel import normal_depth
+
+    # M1 backwater curve upstream of a dam, trapezoidal channel
+    n = 0.025
+    S = 0.001
+    section = Trapezoidal(6., 2., 1.)
+    stations = np.linspace(0., 5000., 51)
+    elevations = 100. + S * stations
+    reach = StandardStep(stations, elevations, section, n, depth_max=10.)
+
+    Qs = np.array([20., 40., 60.])
+    yn, _ = normal_depth(n, S, Qs, Trapezoidal(6., 2., 1.))
+    depth, info = reach.profile(Qs, 5.)
+    print("Normal depths: {0}".format(np.round(yn, 4)))
+    print("Station    y(Q=20)  y(Q=40)  y(Q=60)")
+    for x, y in zip(stations[::10], depth[::10]):
+        print("{:8.1f} {:-8.4f} {:-8.4f} {:-8.4f}".format(x, *y))
@@ -5,49 +5,330 @@ Created on Sun Nov 15 21:18:22 2020
 
 @author: ecoslacker
 """
+import numpy as np
 from rainfall import SCSStorm
 
+# SCS dimensionless unit hydrograph, ratios t/tp and q/qp (NEH-4)
+SCS_UH_T = np.array([0.0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0,
+                     1.1, 1.2, 1.3, 1.4, 1.5, 1.6, 1.7, 1.8, 1.9, 2.0,
+                     2.2, 2.4, 2.6, 2.8, 3.0, 3.2, 3.4, 3.6, 3.8, 4.0,
+                     4.5, 5.0])
+SCS_UH_Q = np.array([0.000, 0.030, 0.100, 0.190, 0.310, 0.470, 0.660, 0.820,
+                     0.930, 0.990, 1.000, 0.990, 0.930, 0.860, 0.780, 0.680,
+                     0.560, 0.460, 0.390, 0.330, 0.280, 0.207, 0.147, 0.107,
+                     0.077, 0.055, 0.040, 0.029, 0.021, 0.015, 0.011, 0.005,
+                     0.000])
+
+# Series longer than this are convolved with FFT
+FFT_LENGTH = 256
+
+def scs_excess(P, S, ia_ratio=0.2):
+    """
+    Cumulative excess rainfall with the SCS curve number equation,
+    Pe = (P - Ia)^2 / (P - Ia + S) for P > Ia, with Ia = ia_ratio * S.
+
+    Parameters
+    ----------
+    P : float or array_like
+        Cumulative rainfall (in or mm).
+    S : float or array_like
+        Potential maximum retention, e.g. S = 1000/CN - 10 (in).
+    ia_ratio : float, optional
+        Ratio of initial abstractions to S. The default is 0.2.
+
+    Returns
+    -------
+    float or ndarray
+        Cumulative excess rainfall, P and S are broadcast.
+
+    """
+    P = np.asarray(P, dtype=float)
+    S = np.asarray(S, dtype=float)
+    Ia = ia_ratio * S
+    wet = np.maximum(P - Ia, 0.)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        Pe = np.where(wet > 0, wet * wet / (wet + S), 0.)
+    return Pe[()]
+
+def scs_unit_hydrograph(qp, tp, step):
+    """
+    Ordinates of the SCS dimensionless unit hydrograph every time step.
+
+    Parameters
+    ----------
+    qp : float or array_like
+        Peak flow rate of the unit hydrograph (e.g. cfs/in).
+    tp : float or array_like
+        Time to peak, hours.
+    step : float
+        Time step, hours.
+
+    Returns
+    -------
+    ndarray
+        The ordinates, one row per (qp, tp) pair for arrays, padded with zeros
+        to the length of the longest unit hydrograph.
+
+    """
+    qp, tp = np.broadcast_arrays(np.asarray(qp, dtype=float), np.asarray(tp, dtype=float))
+    nsteps = int(np.ceil(SCS_UH_T[-1] * tp.max() / step)) + 1
+    t = step * np.arange(nsteps)
+    q = np.interp(t / tp[..., None], SCS_UH_T, SCS_UH_Q, right=0.)
+    return qp[..., None] * q
+
+def convolve(excess, uh):
+    """
+    Convolution of incremental excess rainfall with unit hydrographs along
+    the last axis. Arrays are broadcast, e.g. excess with shape (storms, 1,
+    steps) and uh with shape (catchments, m) give the direct runoff of all
+    storms in all catchments. Long series are convolved with FFT.
+
+    Parameters
+    ----------
+    excess : array_like
+        Incremental excess rainfall of each time step.
+    uh : array_like
+        Unit hydrograph ordinates with the same time step.
+
+    Returns
+    -------
+    ndarray
+        Direct runoff with length steps + m - 1 on the last axis.
+
+    """
+    excess = np.asarray(excess, dtype=float)
+    uh = np.asarray(uh, dtype=float)
+    n = excess.shape[-1] + uh.shape[-1] - 1
+    if excess.ndim == 1 and uh.ndim == 1 and n <= FFT_LENGTH:
+        return np.convolve(excess, uh)
+    # Zero-padding to a power of two avoids the circular convolution
+    nfft = 1 << (n - 1).bit_length()
+    spectrum = np.fft.rfft(excess, nfft) * np.fft.rfft(uh, nfft)
+    return np.fft.irfft(spectrum, nfft)[..., :n]
+
+def direct_runoff(cumulative_rain, S, qp, tp, step, ia_ratio=0.2):
+    """
+    Direct runoff hydrographs of many storms in many catchments.
+
+    Parameters
+    ----------
+    cumulative_rain : array_like
+        Cumulative rainfall, shape (storms, steps), e.g. from
+        rainfall.scs_ensemble.
+    S : array_like
+        Potential maximum retention of each catchment.
+    qp : array_like
+        Peak flow rate of the unit hydrograph of each catchment.
+    tp : array_like
+        Time to peak of each catchment, hours.
+    step : float
+        Time step of the rainfall, hours.
+    ia_ratio : float, optional
+        Ratio of initial abstractions to S. The default is 0.2.
+
+    Returns
+    -------
+    ndarray
+        Direct runoff with shape (storms, catchments, time steps).
+
+    """
+    P = np.atleast_2d(np.asarray(cumulative_rain, dtype=float))
+    S, qp, tp = np.broadcast_arrays(*[np.atleast_1d(np.asarray(x, dtype=float))
+                                      for x in (S, qp, tp)])
+    Pe = scs_excess(P[:, None, :], S[None, :, None], ia_ratio)
+    excess = np.diff(Pe, axis=-1, prepend=0.)
+    uh = scs_unit_hydrograph(qp, tp, step)  # (catchments, ordinates)
+    return convolve(excess, uh[None, :, :])
+
 class Hydrograph:
-    def __init__(self, iabs, qp, storm):
+    def __init__(self, iabs, qp, storm, tp=None, ia_ratio=0.2):
+        """
+        Runoff hydrograph of a storm using the SCS curve number and the SCS
+        dimensionless unit hydrograph.
+
+        Parameters
+        ----------
+        iabs : float
+            Initial abstractions (in or mm), S = iabs / ia_ratio.
+        qp : float
+            Peak flow rate of the unit hydrograph (e.g. cfs/in).
+        storm : SCSStorm
+            The storm, its time step is used for the hydrograph.
+        tp : float
+            Time to peak of the unit hydrograph, hours.
+        ia_ratio : float, optional
+            Ratio of initial abstractions to S. The default is 0.2.
+
+        Returns
+        -------
+        None.
+
+        """
         self._iabs = iabs
         self._qp_uh = qp
+        self._tp = tp
+        self._ia_ratio = ia_ratio
         self._storm = storm
         self._step = 0
         self._time = []
         self._cumulative_runoff = []
+        self._excess = []
+        self._uh = []
+        self._hydrograph = []
         self._qp_sh = 0
-    
+
     def get_cumulative_runoff(self):
         return self._cumulative_runoff
-    
+
+    def get_unit_hydrograph(self):
+        return self._uh
+
+    def get_hydrograph(self):
+        return self._hydrograph
+
+    def get_time(self):
+        return self._time
+
+    def get_peak(self):
+        return self._qp_sh
+
     def runoff(self):
+        """ Computes the excess rainfall and the direct runoff hydrograph """
+        assert self._tp is not None, "Time to peak (tp) of the unit hydrograph is needed"
         # Hydrograph time step should match the step of the hyetograph
         self._step = self._storm.step
-        self._time.clear()
-        self._cumulative_runoff.clear()
-
-        cum_rain = 0
-        cum_time = 0
-        for rain in self._storm.get_hyetograph():
-            cum_rain += rain
-            if cum_rain <= self._iabs:
-                # Account the rainfall into the initial abstractions
-                self._cumulative_runoff.append(0)
-            else:
-                # Once initial abstractions are covered, the runoff can be computed
-                runoff = 5
-                self._cumulative_runoff.append(runoff)
-            self._time.append(cum_time)
-            cum_time += self._step
-        
-        print(self._time)
-        print(self._cumulative_runoff)
-        
-        
-        
-        
+        S = self._iabs / self._ia_ratio
+
+        # Rainfall accounts into the initial abstractions before runoff starts
+        self._cumulative_runoff = scs_excess(self._storm.get_cumulative_rain(), S, self._ia_ratio)
+        self._excess = np.diff(self._cumulative_runoff, prepend=0.)
+        self._uh = scs_unit_hydrograph(self._qp_uh, self._tp, self._step)
+        self._hydrograph = convolve(self._excess, self._uh)
+        self._time = self._storm.time[0] + self._step * np.arange(len(self._hydrograph))
+        self._qp_sh = self._hydrograph.max(initial=0.)
+        return self._hydrograph
+
+class ContinuousHydrograph:
+    def __init__(self, S, qp, tp, step=1., ia_ratio=0.2, dry_time=24.):
+        """
+        Continuous simulation of direct runoff from a long rainfall record
+        (e.g. decades of hourly precipitation) processed by chunks. The state
+        of the storm in progress and the tail of the convolution are carried
+        from one chunk to the next one, so the results are the same as
+        processing the whole record at once.
+
+        A new storm starts when it rains after a dry period of at least
+        dry_time hours, then the SCS curve number equation starts again with
+        the cumulative rainfall of the new storm.
+
+        Parameters
+        ----------
+        S : float
+            Potential maximum retention (in or mm).
+        qp : float
+            Peak flow rate of the unit hydrograph (e.g. cms/mm).
+        tp : float
+            Time to peak of the unit hydrograph, hours.
+        step : float, optional
+            Time step of the rainfall record, hours. The default is 1.
+        ia_ratio : float, optional
+            Ratio of initial abstractions to S. The default is 0.2.
+        dry_time : float, optional
+            Hours without rain that separate two storms. The default is 24.
+
+        Returns
+        -------
+        None.
+
+        """
+        self._S = S
+        self._ia_ratio = ia_ratio
+        self._step = step
+        self._dry_steps = int(np.ceil(dry_time / step))
+        self._uh = scs_unit_hydrograph(qp, tp, step)
+        self.reset()
+
+    def reset(self):
+        """ Starts the simulation again, without previous storms """
+        self._rain = 0.  # cumulative rainfall of the current storm
+        self._excess = 0.  # cumulative excess rainfall of the current storm
+        self._dry = self._dry_steps  # time steps without rain
+        self._tail = np.zeros(len(self._uh) - 1)  # runoff of the next steps
+        self._steps = 0  # time steps simulated
+
+    def get_unit_hydrograph(self):
+        return self._uh
+
+    def update(self, rain):
+        """
+        Simulates the next chunk of the rainfall record.
+
+        Parameters
+        ----------
+        rain : array_like
+            Rainfall depth of each time step, missing values are taken as 0.
+
+        Returns
+        -------
+        ndarray
+            Direct runoff of the time steps of the chunk.
+
+        """
+        p = np.nan_to_num(np.asarray(rain, dtype=float))
+        n = len(p)
+        if n == 0:
+            return np.zeros(0)
+        idx = np.arange(n)
+        wet = p > 0
+
+        # Time steps without rain before each step, continues from last chunk
+        last_wet = np.maximum.accumulate(np.where(wet, idx, -1))
+        dry_after = np.where(last_wet >= 0, idx - last_wet, idx + 1 + self._dry)
+        dry_before = np.concatenate(([self._dry], dry_after[:-1]))
+        new_storm = wet & (dry_before >= self._dry_steps)
+
+        # Cumulative rainfall of the storm of each time step
+        cumsum = np.cumsum(p)
+        start = np.maximum.accumulate(np.where(new_storm, idx, -1))
+        before = np.where(start > 0, cumsum[np.maximum(start - 1, 0)], 0.)
+        P = np.where(start >= 0, cumsum - before, cumsum + self._rain)
+
+        # Incremental excess rainfall, previous excess is 0 at a new storm
+        Pe = scs_excess(P, self._S, self._ia_ratio)
+        Pe_prev = np.concatenate(([self._excess], Pe[:-1]))
+        excess = Pe - np.where(new_storm, 0., Pe_prev)
+
+        # Convolution with the runoff left by the previous chunks
+        out = convolve(excess, self._uh)
+        out[:len(self._tail)] += self._tail
+        self._tail = out[n:n + len(self._uh) - 1].copy()
+
+        self._rain = P[-1]
+        self._excess = Pe[-1]
+        self._dry = dry_after[-1]
+        self._steps += n
+        return out[:n]
+
+    def simulate(self, chunks, column='Precipitation'):
+        """
+        Yields the direct runoff of each chunk of rainfall.
+
+        Parameters
+        ----------
+        chunks : iterable
+            Arrays of rainfall or Data Frames with a rainfall column, e.g.
+            WeatherData.iter_data(['Precipitation']) for hourly data.
+        column : str, optional
+            The rainfall column of Data Frames. The default is 'Precipitation'.
+
+        """
+        for chunk in chunks:
+            rain = chunk[column] if hasattr(chunk, 'columns') else chunk
+            yield self.update(rain)
+
+
 if __name__ == "__main__":
-    
+
     # Generate an exmple storm from HW#3 P6
     PD = 3.34  # rainfall for 12-hr, 100-yr rainfall
     D = 12  # 12-hr rainfall duration
@@ -55,8 +336,11 @@ if __name__ == "__main__":
     storm = SCSStorm(PD, D, ts, SI=False)
     storm.plot_hyetograph()
     print(storm)
-    
+
     Ia = 0.19  # Initial abstractions
-    qp = 242  # peak flowrate for the unit hydrograph in CFS 
-    hydro = Hydrograph(Ia, qp, storm)
-    hydro.runoff()
\ No newline at end of file
+    qp = 242  # peak flowrate for the unit hydrograph in CFS
+    tp = 2.0  # time to peak of the unit hydrograph in hours
+    hydro = Hydrograph(Ia, qp, storm, tp)
+    hydro.runoff()
+    print("Runoff depth: {:-8.4f}".format(hydro.get_cumulative_runoff()[-1]))
+    print("Peak flow:    {:-8.4f}".format(hydro.get_peak()))
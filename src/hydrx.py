@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+hydrx.py
+Package-level API of the library
+
+The functions and classes of all the modules are available from here, e.g.
+hydrx.manningQ or hydrx.SCSStorm, and the modules themselves, e.g.
+hydrx.sensitivity. Modules are imported on first use, so a process that
+only needs Manning's equation does not pay the import of pandas, requests
+or matplotlib (only needed by the weather data and the plots).
+
+Names of the API take precedence over module names: hydrx.manning is the
+function manning, the module is available as hydrx.module('manning').
+
+    import sys
+    sys.path.insert(0, '../src/')
+    import hydrx
+    Q = hydrx.manningQ(0.015, A, R, 0.001)
+
+@author: eduardo
+"""
+import importlib
+
+MODULES = ['manning', 'channel', 'solvers', 'pipes', 'riprap', 'lateral',
+           'rainfall', 'hydrograph', 'tables', 'gvf', 'routing', 'sensitivity',
+           'weather', 'cache', 'archive', 'azmet', 'registry', 'plotting']
+
+# Name of the module of every function and class of the API
+_API = {
+    'manning': ['manning', 'manningQ', 'checkTurbulent', 'Triangular', 'Rectangular',
+                'Trapezoidal', 'Circle', 'NaturalSection'],
+    'channel': ['normal_depth', 'normal_depth_batch', 'design_channel', 'optimal_channel',
+                'CHANNEL_FIELDS'],
+    'solvers': ['expand_bracket', 'find_root', 'Trace'],
+    'pipes': ['full_flow', 'circle_normal_depth', 'smallest_pipe'],
+    'riprap': ['manningDepth', 'riprap_size', 'riprapCSU', 'RIPRAP_FIELDS'],
+    'lateral': ['christiansen_F', 'design_laterals', 'Lateral'],
+    'rainfall': ['scs_ensemble', 'Storm', 'SCSStorm'],
+    'hydrograph': ['scs_excess', 'scs_unit_hydrograph', 'direct_runoff', 'Hydrograph',
+                   'ContinuousHydrograph'],
+    'tables': ['HydraulicTable', 'load_table', 'get_table', 'clear_tables'],
+    'gvf': ['StandardStep'],
+    'routing': ['muskingum', 'cunge_parameters', 'route_network'],
+    'weather': ['WeatherData', 'BlanneyCriddle', 'get_stations_data', 'daytime_percentage',
+                'blaney_criddle_f'],
+    'cache': ['WeatherCache'],
+    'archive': ['WeatherArchive'],
+    'azmet': ['read_raw'],
+    'registry': ['stations', 'station_id', 'station_ids', 'station_names'],
+    'plotting': ['headless'],
+}
+_WHERE = {name: module for module, names in _API.items() for name in names}
+
+__all__ = sorted(set(_WHERE) | set(MODULES) | {'module'})
+
+def module(name):
+    """ Returns a module of the library, imported the first time """
+    assert name in MODULES, "Unknown module '{0}'".format(name)
+    return importlib.import_module(name)
+
+def __getattr__(name):
+    """ Imports the module of a name the first time it is used """
+    if name in _WHERE:
+        value = getattr(importlib.import_module(_WHERE[name]), name)
+    elif name in MODULES:
+        value = module(name)
+    else:
+        raise AttributeError("module 'hydrx' has no attribute '{0}'".format(name))
+    globals()[name] = value  # next time it is found without __getattr__
+    return value
+
+def __dir__():
+    return __all__
@@ -11,7 +11,127 @@ systems. It was developed using the class notes from the Irrigation Department
 of Universidad Autonoma Chapingo, Mexico.
 """
 
-from math import sqrt
+import numpy as np
+
+# Commercial diameters of the lateral pipes, inches
+DIAMETERS = [2, 3, 4, 5, 6, 8, 10, 12]
+
+# Exponent of the flow rate for each head loss equation
+# 0 = Hazen-Williams, 1 = Manning, 2 = Scobey
+EXPONENTS = [1.852, 2.0, 1.9]
+
+def christiansen_F(Nasp, m, first_half):
+    """
+    Christiansen's F factor for a lateral with multiple outlets, accepts
+    arrays of number of sprinklers, exponents and first sprinkler condition.
+
+    Parameters
+    ----------
+    Nasp : int or array_like
+        Number of sprinklers in the lateral.
+    m : float or array_like
+        Exponent of the flow rate in the head loss equation.
+    first_half : bool or array_like
+        True if first sprinkler is at half separation.
+
+    Returns
+    -------
+    float or ndarray
+        The F factor.
+
+    """
+    N, m, first_half = np.broadcast_arrays(np.asarray(Nasp, dtype=int),
+                                           np.asarray(m, dtype=float),
+                                           np.asarray(first_half, dtype=bool))
+    Nf = N.astype(float)
+    # Sum of j^m for j = 1 ... N-1, one cumulative sum for each exponent
+    suma = np.zeros(N.shape)
+    j = np.arange(1, max(N.max(initial=1), 1), dtype=float)
+    for exponent in np.unique(m):
+        rows = (m == exponent)
+        cumsum = np.concatenate(([0.], np.cumsum(np.power(j, exponent))))
+        suma[rows] = cumsum[np.maximum(N[rows] - 1, 0)]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        F_half = 1. / (2. * Nf - 1.) + 2. / ((2. * Nf - 1) * np.power(Nf, m)) * suma
+        F_full = (1. / (m + 1.)) + (1. / (2. * Nf)) + (np.sqrt(m - 1.) / (6. * np.power(Nf, 2.)))
+    return np.where(first_half, F_half, F_full)[()]
+
+def design_laterals(fields, diameters=DIAMETERS):
+    """
+    Design of laterals for many fields at once. The smallest diameter of the
+    catalog that meets the permissible friction loss is selected for every
+    field.
+
+    Parameters
+    ----------
+    fields : pandas.DataFrame or dict
+        A table with one field per row and columns with the same names as
+        the parameters of Lateral: 'sprinkler_flow', 'sprinkler_pressure',
+        'length', 'slope', 'sprinkler_separation', 'equation' and
+        'coefficient'. Optional columns are 'first_sprinkler' (default True)
+        and 'inclination' (default 0, flat).
+    diameters : list, optional
+        Catalog of diameters in inches. The default is DIAMETERS.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Columns 'diameter' (in), 'pressure' (inlet pressure, m), 'flow' (lps),
+        'length' (m), 'sprinklers', 'F' and 'friction_loss' (m). Fields where
+        no diameter of the catalog meets the friction loss have NaN diameter.
+
+    """
+    import pandas as pd  # only needed for the batch design
+    fields = pd.DataFrame(fields)
+    q = fields['sprinkler_flow'].to_numpy(dtype=float)
+    ho = 10 * fields['sprinkler_pressure'].to_numpy(dtype=float)  # to mca
+    lt = fields['length'].to_numpy(dtype=float)
+    s = fields['slope'].to_numpy(dtype=float)
+    sa = fields['sprinkler_separation'].to_numpy(dtype=float)
+    eq = fields['equation'].to_numpy(dtype=int)
+    coef = fields['coefficient'].to_numpy(dtype=float)
+    half = np.ones(len(fields), dtype=bool)
+    if 'first_sprinkler' in fields:
+        half = fields['first_sprinkler'].to_numpy(dtype=bool)
+    inc = np.zeros(len(fields), dtype=int)
+    if 'inclination' in fields:
+        inc = fields['inclination'].to_numpy(dtype=int)
+    assert np.isin(eq, [0, 1, 2]).all(), "Equation should be 0, 1 or 2"
+    he = 1
+
+    # Number of sprinklers and length of the lateral
+    Nasp = ((lt - sa/2) / sa).astype(int) + half
+    Llat = np.where(half, (Nasp - 1) * sa + (sa / 2), Nasp * sa)
+
+    # Permissible friction loss: flat, upward and downward slope
+    hf_perm = 0.2 * ho + np.choose(inc, [0., -1., 1.]) * (s * lt) / 100
+
+    # Friction loss gradient for every field (rows) and diameter (columns)
+    Q = (q * Nasp / 1000)[:, None]
+    d = np.asarray(diameters, dtype=float)[None, :] * 0.0254
+    c = coef[:, None]
+    with np.errstate(divide='ignore'):
+        J = np.choose(eq[:, None], [
+            10.648 * np.power(1. / c, 1.852) * (np.power(Q, 1.852) / np.power(d, 4.871)),
+            10.29 * np.power(c, 2.) * (np.power(Q, 2.) / np.power(d, 16. / 3.)),
+            0.00409379 * c * np.power(d, -4.9) * np.power(Q, 1.9)])
+    m = np.asarray(EXPONENTS)[eq]
+    F = christiansen_F(Nasp, m, half)
+    hf = J * (F * Llat)[:, None]
+
+    # Smallest diameter with friction loss below the permissible
+    ok = hf <= hf_perm[:, None]
+    found = ok.any(axis=1)
+    i = np.argmax(ok, axis=1)
+    hf_sel = np.where(found, hf[np.arange(len(i)), i], np.nan)
+    Hl = ho + (0.75 * hf_sel) + he + ((0.5 * s * Llat) / 100) + (0.1 * ho)
+    return pd.DataFrame({'diameter': np.where(found, np.asarray(diameters)[i], np.nan),
+                         'pressure': Hl,
+                         'flow': q * Nasp,
+                         'length': Llat,
+                         'sprinklers': Nasp,
+                         'F': F,
+                         'friction_loss': hf_sel}, index=fields.index)
 
 class Lateral:
     def __init__(self, sprinkler_flow, sprinkler_pressure, 
@@ -78,7 +198,7 @@ class Lateral:
         self.inc = inclination
         self.eq = equation
 
-        self.diametros = [2, 3, 4, 5, 6, 8, 10, 12]
+        self.diametros = list(DIAMETERS)
     
     def design_lateral(self):
         
@@ -134,16 +254,12 @@ class Lateral:
                 m = 1.9
 
             # Calculo de F de Christiansen
+            self.F = christiansen_F(self.Nasp, m, self.fsep)
             if self.fsep is True:
-                # wx.MessageBox('Primer aspersor a la mitad de separación que Sa')
-                for j in range(self.Nasp):
-                    suma = pow((self.Nasp - (j + 1)), m)
-                self.F = 1. / (2. * self.Nasp - 1.) + 2. / ((2.* self.Nasp - 1) * pow(self.Nasp, m)) * suma
+                # Primer aspersor a la mitad de separación que Sa
                 self.Llat = (self.Nasp - 1) * self.sa + (self.sa / 2)
-                
             elif self.fsep is False:
-                # wx.MessageBox('Primer aspersor a la misma separación que Sa')
-                self.F = (1. / (m + 1.)) + (1. / (2. * self.Nasp)) + (sqrt(m - 1.) / (6. * pow(self.Nasp, 2.)))
+                # Primer aspersor a la misma separación que Sa
                 # Longitud real del lateral para este caso
                 self.Llat = self.Nasp * self.sa
             
@@ -151,7 +267,8 @@ class Lateral:
             self.hf = J * self.F * self.Llat
             i += 1
             
-        self.d_in = self.diametros[i]
+        # The last diameter tested is the one that meets the friction loss
+        self.d_in = self.diametros[i - 1]
         
         # Obtener la carga de entrada del lateral
         self.Hl = self.ho + (0.75 * self.hf) + self.he + ((0.5 * self.s * self.Llat) / 100) + (0.1 * self.ho)
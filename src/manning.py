@@ -7,7 +7,12 @@ sections
 Created on Tue Sep 29 01:40:32 2020
 @author: 0x1A3
 """
-from math import pow, sqrt, sin, cos, acos
+import numpy as np
+
+def _as_float(x):
+    """ Converts x to a float array, scalars are returned as numpy floats """
+    x = np.asarray(x, dtype=float)
+    return x if x.ndim else x[()]
 
 def manning(n, R, S, SI=True):
     """
@@ -15,11 +20,11 @@ def manning(n, R, S, SI=True):
 
     Parameters
     ----------
-    n : float
+    n : float or array_like
         Manning roughness coefficient.
-    R : float
+    R : float or array_like
         hydraulic radius of the cross section (square meters or square foot).
-    S : float
+    S : float or array_like
         Channel slope adimentional units (m/m or ft/ft).
     SI : boolean, optional
         True for International System or metric units (m, s, m^3/s), False for
@@ -27,15 +32,16 @@ def manning(n, R, S, SI=True):
 
     Returns
     -------
-    float
-        Flow velocity in meters (or foot) per second.
+    float or ndarray
+        Flow velocity in meters (or foot) per second. Array inputs are
+        broadcast against each other and an array is returned.
 
     """
     if SI:
         k = 1.
     else:
         k = 1.486 # 1.49 
-    return (k/n) * pow(R, 2/3.) * pow(S, 1/2.)
+    return (k / _as_float(n)) * np.power(_as_float(R), 2/3.) * np.sqrt(_as_float(S))
     
 def manningQ(n, A, R, S, SI=True):
     """
@@ -43,13 +49,13 @@ def manningQ(n, A, R, S, SI=True):
 
     Parameters
     ----------
-    n : float
+    n : float or array_like
         Manning roughness coefficient.
-    A : float
+    A : float or array_like
         Cross-sectional area of the channel in (sq. meters or sq. ft)
-    R : float
+    R : float or array_like
         hydraulic radius of the cross section (square meters or square foot).
-    S : float
+    S : float or array_like
         Channel slope adimentional units (m/m or ft/ft).
     SI : boolean, optional
         True for International System or metric units (m, s, m^3/s), False for
@@ -57,18 +63,40 @@ def manningQ(n, A, R, S, SI=True):
 
     Returns
     -------
-    float
+    float or ndarray
         Flow rate, cubic meters per second (cms) or cubic foot per second (cfs)
 
     """
-    return A * manning(n, R, S, SI)
+    return _as_float(A) * manning(n, R, S, SI)
 
 def checkTurbulent(n, R, S, SI=True):
+    """
+    Check for fully turbulent flow, the condition to apply Manning's equation
+
+    Parameters
+    ----------
+    n : float or array_like
+        Manning roughness coefficient.
+    R : float or array_like
+        hydraulic radius of the cross section.
+    S : float or array_like
+        Channel slope adimentional units (m/m or ft/ft).
+    SI : boolean, optional
+        True for SI units, False for US customary units. The default is True.
+
+    Returns
+    -------
+    val : float or ndarray
+        The value of n^6 * sqrt(R * S).
+    turbulent : bool or ndarray
+        True where the flow is turbulent.
+
+    """
     if SI:
         threshold = 1.1e-13
     else:
         threshold = 1.9e-13
-    val = pow(n, 6) * sqrt(R * S)
+    val = np.power(_as_float(n), 6) * np.sqrt(_as_float(R) * _as_float(S))
     return val, val > threshold 
 
 class Triangular:
@@ -82,33 +110,34 @@ class Triangular:
 
         Parameters
         ----------
-        z : int
+        z : float or array_like
             z is the wall slope represented as 1:z, rise:run
-        y : float
-            y is the depth of the water
+        y : float or array_like
+            y is the depth of the water, an array of depths evaluates all
+            of the geometric properties at once
 
         Returns
         -------
         None.
 
         """     
-        self.z = z
-        self.y = y
+        self.z = _as_float(z)
+        self.y = _as_float(y)
     
     def setDepth(self, y):
-        self.y = y
+        self.y = _as_float(y)
     
     def getArea(self):
         return self.z * self.y * self.y
     
     def getWettedPerimeter(self):
-        return 2. * self.y * sqrt(1 + pow(self.z, 2))
+        return 2. * self.y * np.sqrt(1 + np.power(self.z, 2))
     
     def getHydraulicRadius(self):
         return self.getArea() / self.getWettedPerimeter()
     
     def getTopWidth(self):
-        return 2. + self.z * self.y
+        return 2. * self.z * self.y
     
     def getDesignParameter(self):
         return 8. / (3 * self.y)
@@ -118,9 +147,9 @@ class Rectangular:
         """
         Parameters
         ----------
-        B : float
+        B : float or array_like
             B is the base of the channel
-        y : float
+        y : float or array_like
             y is the depth of the water
 
         Returns
@@ -128,11 +157,11 @@ class Rectangular:
         None.
 
         """
-        self.B = B
-        self.y = y
+        self.B = _as_float(B)
+        self.y = _as_float(y)
     
     def setDepth(self, y):
-        self.y = y
+        self.y = _as_float(y)
         
     def getArea(self):
         return self.B * self.y
@@ -144,48 +173,80 @@ class Rectangular:
         return self.getArea() / self.getWettedPerimeter()
     
     def getTopWidth(self):
-        return self.B
+        return self.B * np.ones_like(self.y)
     
     def getDesignParameter(self):
         return (5. * self.B + 6. * self.y) / (3. * self.y * (self.B + 2. * self.y))
     
 class Trapezoidal:
     def __init__(self, B, z, y):
-        self.B = B
-        self.z = z
-        self.y = y
+        """
+        Parameters
+        ----------
+        B : float or array_like
+            B is the base of the channel
+        z : float or array_like
+            z is the wall slope represented as 1:z, rise:run
+        y : float or array_like
+            y is the depth of the water
+
+        Returns
+        -------
+        None.
+
+        """
+        self.B = _as_float(B)
+        self.z = _as_float(z)
+        self.y = _as_float(y)
         
     def setDepth(self, y):
-        self.y = y
+        self.y = _as_float(y)
         
     def getArea(self):
         return (self.B + self.z * self.y) * self.y
     
     def getWettedPerimeter(self):
-        return self.B + 2. * self.y * sqrt(1. + pow(self.z, 2))
+        return self.B + 2. * self.y * np.sqrt(1. + np.power(self.z, 2))
     
     def getHydraulicRadius(self):
         return self.getArea() / self.getWettedPerimeter()
     
     def getTopWidth(self):
-        return self.B + 2. * self.z + self.y
+        return self.B + 2. * self.z * self.y
     
     def getDesignParameter(self):
         num = (self.B + 2. * self.z * self.y) * (5. * self.B + 6. * self.y * \
-            sqrt(1. + pow(self.z, 2))) + 4. * self.z * pow(self.y, 2) * \
-            sqrt(1. + pow(self.z, 2))
+            np.sqrt(1. + np.power(self.z, 2))) + 4. * self.z * np.power(self.y, 2) * \
+            np.sqrt(1. + np.power(self.z, 2))
         den = 3. * self.y * (self.B + self.z * self.y) * (self.B + 2. * 
-            self.y * sqrt(1. + pow(self.z, 2)))
+            self.y * np.sqrt(1. + np.power(self.z, 2)))
         return num / den
 
 class Circle:
     def __init__(self, d, y):
-        self.d = d
-        self.y = y
-        self.theta = 2. * acos(1. - ((2. * self.y) / self.d))
+        """
+        Parameters
+        ----------
+        d : float or array_like
+            d is the diameter of the conduit
+        y : float or array_like
+            y is the depth of the water, from 0 up to d
+
+        Returns
+        -------
+        None.
+
+        """
+        self.d = _as_float(d)
+        self.setDepth(y)
+    
+    def setDepth(self, y):
+        self.y = _as_float(y)
+        # Angle subtended by the water surface at the center
+        self.theta = 2. * np.arccos(1. - ((2. * self.y) / self.d))
         
     def getArea(self):
-        return 1./8. * (self.theta - sin(self.theta)) * pow(self.d, 2)
+        return 1./8. * (self.theta - np.sin(self.theta)) * np.power(self.d, 2)
     
     def getWettedPerimeter(self):
         return 0.5 * self.theta * self.d
@@ -194,18 +255,149 @@ class Circle:
         return self.getArea() / self.getWettedPerimeter()
     
     def getTopWidth(self):
-        return (sin(self.theta / 2.)) * self.d
+        return (np.sin(self.theta / 2.)) * self.d
     
     def getTopWidthFromY(self):
-        return 2. * sqrt(self.y * (self.d - self.y))
+        return 2. * np.sqrt(self.y * (self.d - self.y))
     
     def getDesignParameter(self):
-        num = 4. * (2. * sin(self.theta) + 3. * self.theta - 5. * \
-                    self.theta * cos(self.theta))
-        den = 3. * self.d * self.theta * (self.theta - sin(self.theta)) * \
-            sin(self.theta / 2.)
+        num = 4. * (2. * np.sin(self.theta) + 3. * self.theta - 5. * \
+                    self.theta * np.cos(self.theta))
+        den = 3. * self.d * self.theta * (self.theta - np.sin(self.theta)) * \
+            np.sin(self.theta / 2.)
         return num / den
 
+def _sweep(x0, z0, x1, z1, h):
+    """
+    Area, wetted perimeter and top width below the water surface elevations
+    h of a polyline given by its segments (x0, z0)-(x1, z1).
+
+    Each segment adds nothing below its lowest point, a quadratic (area) or
+    linear (perimeter, top width) term while partially wet, and a linear
+    (area) or constant term when submerged. The segments are sorted by their
+    lowest and highest elevations and the terms accumulated with cumulative
+    sums, so every depth is a binary search instead of a pass over the points.
+
+    """
+    lo, hi = np.minimum(z0, z1), np.maximum(z0, z1)
+    dz = hi - lo
+    w = np.abs(x1 - x0)
+    L = np.hypot(w, dz)
+    flat = dz <= 0.
+    dz_ = np.where(flat, 1., dz)
+    # Partially wet terms: area c*(h-lo)^2, perimeter p*(h-lo), top width t*(h-lo)
+    c = np.where(flat, 0., w / (2. * dz_))
+    p = np.where(flat, 0., L / dz_)
+    t = np.where(flat, 0., w / dz_)
+
+    def cumulative(order, *values):
+        return [np.concatenate(([0.], np.cumsum(v[order]))) for v in values]
+
+    order_lo = np.argsort(lo, kind='stable')
+    order_hi = np.argsort(hi, kind='stable')
+    # Segments wet (lo < h) and submerged (hi < h) for each elevation
+    iwet = np.searchsorted(lo[order_lo], h, side='left')
+    isub = np.searchsorted(hi[order_hi], h, side='left')
+
+    # Partial terms of the wet segments minus those already submerged
+    terms = (c, c * lo, c * lo * lo, p, p * lo, t, t * lo)
+    wet = [s[iwet] for s in cumulative(order_lo, *terms)]
+    sub = [s[isub] for s in cumulative(order_hi, *terms)]
+    part = [a - b for a, b in zip(wet, sub)]
+    full = [s[isub] for s in cumulative(order_hi, w, w * (lo + hi) / 2., L)]
+
+    area = part[0] * h * h - 2. * part[1] * h + part[2] + full[0] * h - full[1]
+    perimeter = part[3] * h - part[4] + full[2]
+    top = part[5] * h - part[6] + full[0]
+    return area, perimeter, top
+
+class NaturalSection:
+    """ NaturalSection
+
+    An irregular cross section of a natural stream given by station-elevation
+    points, optionally subdivided in zones with different roughness (e.g.
+    main channel and overbanks). The depth is measured from the lowest point.
+    Water above the end points is confined by vertical walls without friction.
+    """
+    def __init__(self, stations, elevations, y, n=None, breaks=None):
+        """
+        Parameters
+        ----------
+        stations : array_like
+            Horizontal distance of the survey points, increasing.
+        elevations : array_like
+            Ground elevation of the survey points.
+        y : float or array_like
+            Depth of the water above the lowest point.
+        n : float or array_like, optional
+            Manning roughness coefficient of each zone, used by
+            getConveyance. The default is None.
+        breaks : array_like, optional
+            Stations that divide the zones, len(n) - 1 values. The default
+            is None, a single zone.
+
+        Returns
+        -------
+        None.
+
+        """
+        x = np.asarray(stations, dtype=float)
+        z = np.asarray(elevations, dtype=float)
+        assert x.ndim == 1 and x.shape == z.shape and len(x) > 1, \
+            'Stations and elevations should be 1-D arrays of the same length'
+        assert np.all(np.diff(x) >= 0), 'Stations should be increasing'
+        breaks = np.sort(np.asarray([] if breaks is None else breaks, dtype=float))
+        if n is not None:
+            assert np.size(n) == len(breaks) + 1, 'One roughness per zone is required'
+
+        # Add the zone breaks as survey points, then assign zones to segments
+        new = breaks[(breaks > x[0]) & (breaks < x[-1]) & ~np.isin(breaks, x)]
+        z = np.concatenate((z, np.interp(new, x, z)))
+        x = np.concatenate((x, new))
+        order = np.argsort(x, kind='stable')
+        self.stations, self.elevations = x[order], z[order]
+        self.bottom = self.elevations.min()
+        self.n = None if n is None else _as_float(n)
+        self.breaks = breaks
+        self.zone = np.searchsorted(breaks, 0.5 * (self.stations[:-1] + self.stations[1:]))
+        self.setDepth(y)
+
+    def setDepth(self, y):
+        self.y = _as_float(y)
+        h = self.bottom + np.ravel(self.y)
+        x0, x1 = self.stations[:-1], self.stations[1:]
+        z0, z1 = self.elevations[:-1], self.elevations[1:]
+        # Properties of each zone, shape (zones, depths)
+        zones = [_sweep(x0[k], z0[k], x1[k], z1[k], h)
+                 for k in (self.zone == i for i in range(len(self.breaks) + 1))]
+        shape = (len(zones),) + np.shape(self.y)
+        self._area, self._perimeter, self._top = \
+            [np.array([zone[j] for zone in zones]).reshape(shape) for j in range(3)]
+
+    def getArea(self):
+        return self._area.sum(axis=0)[()]
+
+    def getWettedPerimeter(self):
+        return self._perimeter.sum(axis=0)[()]
+
+    def getHydraulicRadius(self):
+        return self.getArea() / self.getWettedPerimeter()
+
+    def getTopWidth(self):
+        return self._top.sum(axis=0)[()]
+
+    def getWaterSurface(self):
+        return self.bottom + self.y
+
+    def getConveyance(self, SI=True):
+        """ Conveyance K = sum of (k/n) A R^(2/3) of the zones, Q = K sqrt(S) """
+        assert self.n is not None, 'The roughness of the zones is required'
+        k = 1. if SI else 1.486
+        n = np.reshape(self.n, (-1,) + (1,) * np.ndim(self.y))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            R = np.where(self._perimeter > 0, self._area / self._perimeter, 0.)
+        return ((k / n) * self._area * np.power(R, 2/3.)).sum(axis=0)[()]
+
 if __name__ == "__main__":
     n = 0.017
     z = 2.
@@ -228,5 +420,22 @@ if __name__ == "__main__":
     print("Hydraulic radius (R): {:-8.4f}".format(R))
     print("Discharge (Q):        {:-8.4f}".format(Q))
     print("Flow is turbulent:    {}".format(cond))
+    
+    # Rating curve, all the depths are evaluated at once
+    depths = np.linspace(0.5, 6., 12)
+    triang.setDepth(depths)
+    Qs = manningQ(n, triang.getArea(), triang.getHydraulicRadius(), S, SI)
+    print("\nRating curve\n       y        Q")
+    for (yi, Qi) in zip(depths, Qs):
+        print("{:-8.4f} {:-8.4f}".format(yi, Qi))
+
 
 
+    # Natural stream with overbanks, one roughness for each zone
+    natural = NaturalSection([0., 10., 20., 22., 26., 28., 40., 50.],
+                             [4., 3., 2.5, 0., 0., 2.5, 3., 4.2], depths / 2.,
+                             n=[0.06, 0.035, 0.06], breaks=[20., 28.])
+    Qs = natural.getConveyance(True) * np.sqrt(0.001)
+    print("\nNatural section rating curve\n       y        A        Q")
+    for (yi, Ai, Qi) in zip(natural.y, natural.getArea(), Qs):
+        print("{:-8.4f} {:-8.4f} {:-8.4f}".format(yi, Ai, Qi))
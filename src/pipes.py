@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+pipes.py
+Partially full flow in circular conduits (storm sewers, culverts)
+
+The discharge of a circular conduit is not monotonic with the depth: the
+maximum is about 1.076 times the full flow capacity at 93.8% of the
+diameter. Normal depths are searched on the rising part of the curve, so
+discharges between the full capacity and the maximum get the lower depth.
+
+@author: eduardo
+"""
+import numpy as np
+from manning import manningQ, Circle
+from solvers import find_root
+
+# Fill ratio y/d of the maximum discharge, where dQ/dy = 0
+FILL_QMAX = 0.9382
+
+def full_flow(d, n, S, SI=True):
+    """
+    Capacity of circular conduits flowing full, arrays are accepted.
+
+    Parameters
+    ----------
+    d : float or array_like
+        Diameter (m or ft).
+    n : float or array_like
+        Manning roughness coefficient.
+    S : float or array_like
+        Slope (m/m or ft/ft).
+    SI : boolean, optional
+        True for SI units, False for US customary units. The default is True.
+
+    Returns
+    -------
+    float or ndarray
+        Full flow capacity (cms or cfs).
+
+    """
+    d = np.asarray(d, dtype=float)
+    return manningQ(n, np.pi * d * d / 4., d / 4., S, SI)
+
+def relative_discharge(fill):
+    """ Ratio Q/Qfull for fill ratios y/d, the same for any conduit when
+    the roughness does not change with the depth """
+    section = Circle(1., fill)
+    A, R = section.getArea(), section.getHydraulicRadius()
+    return (A / (np.pi / 4.)) * np.power(R / 0.25, 2/3.)
+
+def circle_normal_depth(d, n, S, Q, SI=True, **kwargs):
+    """
+    Normal depth of circular conduits for arrays of pipes and discharges.
+
+    Parameters
+    ----------
+    d, n, S : float or array_like
+        Diameter, Manning roughness and slope of each conduit.
+    Q : float or array_like
+        Discharge of each conduit.
+    SI : boolean, optional
+        True for SI units, False for US customary units. The default is True.
+    xtol : float, optional
+        Tolerance of the fill ratio. The default is 1E-10.
+
+    Returns
+    -------
+    dict
+        Arrays 'depth', 'fill' (y/d), 'velocity', 'capacity' (full flow) and
+        'surcharged' (True when Q exceeds the maximum discharge, then depth,
+        fill and velocity are NaN).
+
+    """
+    d, n, S, Q = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (d, n, S, Q)])
+    capacity = full_flow(d, n, S, SI)
+    ratio = Q / capacity
+    qmax = relative_discharge(FILL_QMAX)
+    surcharged = ratio > qmax
+
+    # Solve Q(y)/Qfull = Q/Qfull on the rising part, 0 <= y/d <= FILL_QMAX
+    r = np.where(surcharged, qmax, ratio)
+    fill, info = find_root(lambda f: relative_discharge(f) - r, 0., FILL_QMAX,
+                           fa=-r, fb=qmax - r, xtol=kwargs.get('xtol', 1E-10))
+    fill = np.where(surcharged, np.nan, fill)
+    depth = fill * d
+    section = Circle(d, np.nan_to_num(depth))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        velocity = np.where(surcharged, np.nan, Q / section.getArea())
+    return {'depth': depth[()], 'fill': fill[()], 'velocity': velocity[()],
+            'capacity': capacity[()], 'surcharged': surcharged[()]}
+
+def smallest_pipe(Q, n, S, catalog, max_fill=1., SI=True):
+    """
+    Smallest diameter of a catalog that carries the design discharges.
+
+    Parameters
+    ----------
+    Q, n, S : float or array_like
+        Design discharge, Manning roughness and slope of each conduit.
+    catalog : array_like
+        Commercial diameters (m or ft), in increasing order.
+    max_fill : float, optional
+        Maximum fill ratio y/d of the design, 1 uses the full flow capacity.
+        The default is 1.
+    SI : boolean, optional
+        True for SI units, False for US customary units. The default is True.
+
+    Returns
+    -------
+    float or ndarray
+        The diameter, NaN if none of the catalog carries the discharge.
+
+    """
+    Q, n, S = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (Q, n, S)])
+    catalog = np.asarray(catalog, dtype=float)
+    fraction = 1. if max_fill >= 1. else relative_discharge(max_fill)
+    # Capacity of every conduit (rows) with every diameter (columns)
+    capacity = fraction * full_flow(catalog, n[..., None], S[..., None], SI)
+    ok = capacity >= Q[..., None]
+    return np.where(ok.any(axis=-1), catalog[np.argmax(ok, axis=-1)], np.nan)[()]
+
+if __name__ == "__main__":
+    # Storm sewers with n = 0.013 and several discharges
+    d = 0.6
+    n = 0.013
+    S = 0.005
+    Qs = np.array([0.05, 0.2, 0.4, 0.45, 0.6])
+    res = circle_normal_depth(d, n, S, Qs)
+    print("Full flow capacity: {:-8.4f}".format(res['capacity'][0]))
+    print("       Q        y      y/d        v")
+    for Q, y, f, v in zip(Qs, res['depth'], res['fill'], res['velocity']):
+        print("{:-8.4f} {:-8.4f} {:-8.4f} {:-8.4f}".format(Q, y, f, v))
+
+    catalog = [0.3, 0.375, 0.45, 0.525, 0.6, 0.75, 0.9, 1.05, 1.2]
+    print("Smallest pipes: {0}".format(smallest_pipe(Qs, n, S, catalog, max_fill=0.8)))
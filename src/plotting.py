@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+plotting.py
+Lazy access to matplotlib and headless mode
+
+matplotlib is imported the first time a figure is drawn, not when the
+modules are imported. In headless mode (no display, or the environment
+variable HYDRX_HEADLESS=1) the non-interactive 'Agg' backend is used and
+figures are only saved to files, never shown.
+
+@author: eduardo
+"""
+import os
+import sys
+
+def headless():
+    """ True if figures cannot (or should not) be shown on a display """
+    setting = os.environ.get('HYDRX_HEADLESS', '')
+    if setting:
+        return setting not in ('0', 'false', 'False')
+    return sys.platform.startswith('linux') and \
+        not (os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY'))
+
+def pyplot():
+    """ Returns matplotlib.pyplot, imported only the first time """
+    if 'matplotlib.pyplot' not in sys.modules and headless():
+        import matplotlib
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+def show(fig=None):
+    """ Shows a figure (or all of them), nothing is done in headless mode """
+    if headless():
+        return
+    if fig is None:
+        pyplot().show()
+    else:
+        fig.show()
@@ -6,7 +6,82 @@ Created on Thu Nov  5 15:35:00 2020
 @author: Eduardo Jiménez Hernández
 """
 import csv
-import matplotlib.pyplot as plt
+import numpy as np
+from plotting import pyplot, show
+
+def scs_time(duration, step):
+    """
+    Time grid of a storm centered in the SCS 24-hour distribution, from
+    12-D/2 up to the first step at or after 12+D/2 (limited to 0-24 hr).
+    Times are floats, so steps like 0.667 hr are kept exactly.
+
+    Returns
+    -------
+    ini : float or ndarray
+        Start time of the storm, in hours.
+    nsteps : int or ndarray
+        Number of time steps, the grid has nsteps + 1 points.
+
+    """
+    duration = np.asarray(duration, dtype=float)
+    ini = np.maximum(12. - duration / 2., 0.)
+    end = np.minimum(12. + duration / 2., 24.)
+    nsteps = np.ceil((end - ini) / step - 1E-9).astype(int)
+    return ini[()], nsteps[()]
+
+def curvetype2(t):
+    """ Vectorized SCS Type Curves II and III, see SCSStorm.curvetype2 """
+    T = np.asarray(t, dtype=float) - 12
+    return (0.5 + (T / 24) * np.power(24.04 / (2 * np.abs(T) + 0.04), 0.75))[()]
+
+def scs_ensemble(depths, durations, tstep=0.5):
+    """
+    Hyetographs of many SCS storms at once. Depths and durations are
+    broadcast against each other and every pair is a storm, e.g. use
+    depths[:, None] and durations[None, :] for all the combinations.
+
+    Parameters
+    ----------
+    depths : float or array_like
+        Rainfall depths of the storms, in inches or mm.
+    durations : float or array_like
+        Durations of the storms, in hours (0 up to 24).
+    tstep : float, optional
+        Time step, in hours. The default is 0.5.
+
+    Returns
+    -------
+    time : ndarray
+        Time of each step, shape (storms, steps). Storms shorter than the
+        longest one are padded with NaN.
+    cumulative : ndarray
+        Cumulative rainfall, padded with the storm depth.
+    hyetograph : ndarray
+        Incremental rainfall of each time step, padded with zeros.
+
+    """
+    depths, durations = np.broadcast_arrays(np.asarray(depths, dtype=float),
+                                            np.asarray(durations, dtype=float))
+    depths, durations = depths.ravel(), durations.ravel()
+    assert np.all((durations >= 0) & (durations <= 24)), "Storm duration should be between 0 and 24 hr"
+
+    # Evaluate the curve only once for each different duration
+    udur, inv = np.unique(durations, return_inverse=True)
+    ini, nsteps = scs_time(udur, tstep)
+    ini, nsteps = np.atleast_1d(ini), np.atleast_1d(nsteps)
+    k = np.arange(nsteps.max() + 1)
+    time = ini[:, None] + tstep * k[None, :]
+    inside = k[None, :] <= nsteps[:, None]
+    time_end = np.take_along_axis(time, nsteps[:, None], axis=1)
+    pt = curvetype2(np.where(inside, time, time_end))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraction = (pt - pt[:, :1]) / (pt[:, -1:] - pt[:, :1])
+    fraction = np.nan_to_num(fraction)  # zero duration storms
+
+    cumulative = depths[:, None] * fraction[inv]
+    hyetograph = np.diff(cumulative, axis=1, prepend=0.)
+    time = np.where(inside, time, np.nan)[inv]
+    return time, cumulative, hyetograph
 
 class Storm:
     def __init__(self, rainfall, duration=24, timestep=0.5, SI=True):
@@ -121,24 +196,18 @@ class SCSStorm(Storm):
             (pp. 37–103). https://doi.org/10.1016/b978-0-08-057164-5.50007-4
 
         """
-        T = t-12
-        Pt = 0.5 + (T / 24) * pow(24.04 / (2 * abs(T) + 0.04), 0.75)
-        return Pt
+        return curvetype2(t)
     
     def scs_curve(self):
         """Creates a dimensionless rainfall temporal pattern for
         SCS Type Curves II and III
         """
-        ini, end = 12-self.duration/2., 12+self.duration/2.
-    
-        if ini < 0: ini = 0
-        if end > 24: end = 24  # SCS is based on the 24-hr rainfall
+        # SCS is based on the 24-hr rainfall
+        ini, nsteps = scs_time(self.duration, self.step)
         
-        # Generate a list of time steps and their corresponding ordinate P/P24
-        self.time = [x/100 for x in range(int(ini*100),
-                                          int((end+self.step)*100),
-                                          int(self.step*100))]
-        self.pt = [self.curvetype2(t) for t in self.time]
+        # Generate an array of time steps and their corresponding ordinate P/P24
+        self.time = ini + self.step * np.arange(nsteps + 1)
+        self.pt = curvetype2(self.time)
         
         return self.time, self.pt
     
@@ -153,21 +222,14 @@ class SCSStorm(Storm):
 
     def generate_hyetograph(self):
         """Generate the hyetograph"""
-        self.cumulative_rain.clear()
-        self.hyetograph.clear()
+        if len(self.pt) < 2:
+            return
         
         # Calculate the cumulative rain for each time step
-        for Pt in self.pt:
-            rain = self.rainfall * ((Pt - self.pt[0])/(self.pt[-1] - self.pt[0]))
-            self.cumulative_rain.append(rain)
-        
-        if len(self.cumulative_rain) == 0:
-            return
+        self.cumulative_rain = self.rainfall * ((self.pt - self.pt[0])/(self.pt[-1] - self.pt[0]))
         
         # Get the rainfall intervals (hyetograph) from the cumulativa rainfall
-        self.hyetograph.append(self.cumulative_rain[0])
-        for i in range(1, len(self.cumulative_rain)):
-            self.hyetograph.append(self.cumulative_rain[i] - self.cumulative_rain[i-1])
+        self.hyetograph = np.diff(self.cumulative_rain, prepend=0.)
 
         # Update the string representation
         self.str += self.table_hyetograph()
@@ -185,6 +247,7 @@ class SCSStorm(Storm):
         return text
     
     def plot_curve(self, title="", filename=""):
+        plt = pyplot()
         fig_curve = plt.figure(figsize=(16, 9))
         plt.plot(self.time, self.pt)
         
@@ -196,12 +259,13 @@ class SCSStorm(Storm):
         
         if filename != "":
             plt.savefig(filename, bbox_inches='tight', dpi=300, transparent=True)
-        fig_curve.show()
+        show(fig_curve)
     
     def plot_hyetograph(self, title="", filename=""):
         w = 0.2
         if (len(self.hyetograph) <= 12):
             w=0.3
+        plt = pyplot()
         fig_hyeto = plt.figure(figsize=(16, 9))
         plt.bar(self.time, self.hyetograph, align='edge', width=w)
          
@@ -213,7 +277,7 @@ class SCSStorm(Storm):
         
         if filename != "":
             plt.savefig(filename, bbox_inches='tight', dpi=300, transparent=True)
-        fig_hyeto.show()
+        show(fig_hyeto)
     
     def save_hyetograp(self, filename):
         with open(filename, 'w') as f:
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+registry.py
+Station metadata, column schemas and tables shipped in the doc directory
+
+The files are found relative to this module, not to the working directory,
+and each one is read only once per process, so creating thousands of
+weather station objects does no file I/O after the first one.
+
+@author: eduardo
+"""
+import os
+from functools import lru_cache
+
+DOC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'doc')
+LOCATIONS_FILE = os.path.join(DOC_DIR, 'AZ_locations')
+DAYTIME_HOURS_FILE = os.path.join(DOC_DIR, 'daytime_mean_hours.csv')
+# Column names of the raw files for each time step
+HEADER_FILES = {'daily': os.path.join(DOC_DIR, 'vars_daily_short'),
+                'hourly': os.path.join(DOC_DIR, 'vars_hourly')}
+ID_PLACES = 2  # digits of the station ID
+
+@lru_cache(maxsize=None)
+def read_values(filename):
+    """ Values of a text file, one per line without trailing characters """
+    with open(filename, 'r') as f:
+        return tuple(value.strip() for value in f.readlines())
+
+def stations():
+    """ Names of the weather stations, in the order of their IDs """
+    return read_values(LOCATIONS_FILE)
+
+@lru_cache(maxsize=None)
+def station_ids():
+    """ Dict of station name to two-digit ID, e.g. 'Tucson': '01' """
+    return {name: str(i + 1).zfill(ID_PLACES) for i, name in enumerate(stations())}
+
+@lru_cache(maxsize=None)
+def station_names():
+    """ Dict of two-digit ID to station name, e.g. '01': 'Tucson' """
+    return {sid: name for name, sid in station_ids().items()}
+
+def station_id(name, default='--'):
+    """ Two-digit ID of a station name, default if it is unknown """
+    return station_ids().get(name, default)
+
+def headers(timestep):
+    """ Column names of the raw 'daily' or 'hourly' files """
+    assert timestep in HEADER_FILES, "Time step should be 'daily' or 'hourly'"
+    return read_values(HEADER_FILES[timestep])
+
+@lru_cache(maxsize=None)
+def schema(timestep):
+    """ Data types of the columns of the raw 'daily' or 'hourly' files, the
+    dict is shared by all the callers and should not be modified """
+    from azmet import schema as raw_schema
+    return raw_schema(headers(timestep))
+
+@lru_cache(maxsize=None)
+def read_daytime_hours(filename=DAYTIME_HOURS_FILE):
+    """ Mean Daily Percentage of Annual Daytime Hours, p, by month for
+    different Latitudes. The table is read only once per file """
+    import pandas as pd
+    return pd.read_csv(filename)
+
+@lru_cache(maxsize=None)
+def daytime_hours_array(filename=DAYTIME_HOURS_FILE):
+    """ The daytime hours table as arrays: latitudes and the values of 'p'
+    with shape (2, 12, latitudes), first axis is North and South hemisphere
+    and second axis is the calendar month (January is 0) """
+    import numpy as np
+    table = read_daytime_hours(filename)
+    latitudes = table.columns.values[2:].astype(float)
+    values = table[table.columns.values[2:]].to_numpy(dtype=float)
+    p = np.empty((2, 12, len(latitudes)))
+    p[0, table['North'].to_numpy() - 1] = values
+    p[1, table['South'].to_numpy() - 1] = values
+    return latitudes, p
@@ -5,17 +5,89 @@ Created on Wed Oct 21 11:08:19 2020
 
 @author: 0x1A3
 """
+import time
 from math import pow, cos, sin, tan, radians
+import numpy as np
+from solvers import Trace
+
+# Values recorded by a trace of riprapCSU, one row per iteration
+RIPRAP_FIELDS = ['i', 'D', 'n', 'd', 'tau', 'eta', 'SFb', 'diff']
 
 def manningDepth(n, b, Q, S, SI=True):
+    """ Depth of flow in a wide channel, arrays are accepted """
     if SI:
         k = 1.
     else:
         k = 1.49 # 1.486 
-    return pow(((n * Q)/(k * b * pow(S, 1/2.))), 3/5.)
+    return np.power(((np.asarray(n) * Q)/(k * np.asarray(b) * np.sqrt(S))), 3/5.)
+
+def riprap_size(b, Q, S, phi, theta, SG, SF=1.5, SI=True):
+    """
+    Riprap size with the Colorado State University (CSU) safety factor method
+    for arrays of channels. All the parameters are broadcast against each
+    other, so hundreds of reaches are sized in one call.
+
+    The flow depth of a wide channel grows with D50^(1/10), hence the
+    stability factor is eta = K * D50^(-9/10) and the safety factor equation
+    SFb(D50) = SF is solved exactly instead of increasing D50 by small steps.
+
+    Parameters
+    ----------
+    b : float or array_like
+        Bottom width of the channel (m or ft).
+    Q : float or array_like
+        Design discharge (cms or cfs).
+    S : float or array_like
+        Channel slope (m/m or ft/ft).
+    phi : float or array_like
+        Angle of repose of the stone, degrees.
+    theta : float or array_like
+        Angle of the side slope, degrees.
+    SG : float or array_like
+        Specific gravity of the stone.
+    SF : float or array_like, optional
+        Required safety factor. The default is 1.5.
+    SI : boolean, optional
+        True for SI units, False for US customary units. The default is True.
+
+    Returns
+    -------
+    dict
+        Arrays 'D50', 'n', 'd', 'tau', 'eta' and 'SFb'. Rows where the safety
+        factor cannot be reached, SF >= tan(phi)/tan(theta), are NaN.
+
+    """
+    # specific weight of water
+    gamma = 9810 if SI else 62.4  # N/m^3 or lb/ft^3
+    b, Q, S, phi, theta, SG, SF = np.broadcast_arrays(*[np.asarray(x, dtype=float)
+        for x in (b, Q, S, phi, theta, SG, SF)])
+    tphi, th = np.tan(np.radians(phi)), np.radians(theta)
 
+    # Stability factor required to get the safety factor SF
+    eta_req = (np.cos(th) * tphi / SF - np.sin(th)) / tphi
+    feasible = eta_req > 0
+    # Depth and stability factor for D50 = 1, n = 0.0395 D50^(1/6) Eq. 4.32
+    K = 21. * manningDepth(0.0395, b, Q, S, SI) * S / (SG - 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        D = np.where(feasible, np.power(K / eta_req, 1. / 0.9), np.nan)[()]
 
-def riprapCSU(b, Q, S, phi, theta, SG, SF=1.5, SI=True):
+    n = 0.0395 * np.power(D, 1/6.)
+    d = manningDepth(n, b, Q, S, SI)
+    tau = gamma * d * S
+    eta = (21. * tau) / (gamma * (SG - 1) * D)
+    SFb = (np.cos(th) * tphi) / (np.sin(th) + eta * tphi)
+    return {'D50': D, 'n': n, 'd': d, 'tau': tau, 'eta': eta, 'SFb': SFb}
+
+
+def riprapCSU(b, Q, S, phi, theta, SG, SF=1.5, SI=True, **kwargs):
+    """ Riprap size increasing D50 by small steps until the safety factor
+    is met, see riprap_size for the exact solution of many channels.
+    disp: int, optional, print every disp iterations, default 0 (quiet)
+    trace: Trace, optional, records the iterations (RIPRAP_FIELDS) and the
+        counters of iterations, evaluations and wall time """
+    _disp = kwargs.get('disp', 0)
+    _trace = kwargs.get('trace', None)
+    start = time.perf_counter()
     D = 0.01
     inc = 1E-2
     tol = 1E-2
@@ -46,9 +118,17 @@ def riprapCSU(b, Q, S, phi, theta, SG, SF=1.5, SI=True):
     
     c_iter = 0  # Initialize the current iteration
     
-    print("\nSearching riprap size by iterations\n")
-    print("Iter        D        n       phi        d       tau      eta      SFb     Diff   Accept?")
-    print("{:8} {:-8.4f} {:-8.4f} {:-8.4f} {:-8.4f} {:-8.4f} {:-8.4f} {:-8.4f} {:-8.4f} {:^8}".format(c_iter, D, n, phi, d, tau, eta, SFb, diff, str(accept)))
+    def show():
+        # Record and print the iteration rows
+        if _trace is not None:
+            _trace.record(c_iter, D, n, d, tau, eta, SFb, diff)
+        if _disp and (c_iter % _disp) == 0:
+            print("{:8} {:-8.4f} {:-8.4f} {:-8.4f} {:-8.4f} {:-8.4f} {:-8.4f} {:-8.4f} {:-8.4f} {:^8}".format(c_iter, D, n, phi, d, tau, eta, SFb, diff, str(accept)))
+
+    if _disp:
+        print("\nSearching riprap size by iterations\n")
+        print("Iter        D        n       phi        d       tau      eta      SFb     Diff   Accept?")
+    show()
     
     while (accept != True and c_iter < max_iter):
         D += inc
@@ -66,9 +146,12 @@ def riprapCSU(b, Q, S, phi, theta, SG, SF=1.5, SI=True):
         SFb = safety_factor(theta, phi, eta)
         diff = SF - SFb
         accept = abs(diff) < tol
-        
-        print("{:8} {:-8.4f} {:-8.4f} {:-8.4f} {:-8.4f} {:-8.4f} {:-8.4f} {:-8.4f} {:-8.4f} {:^8}".format(c_iter, D, n, phi, d, tau, eta, SFb, diff, str(accept)))
+        show()
 
+    if _trace is not None:
+        _trace.iterations += c_iter
+        _trace.evaluations += c_iter + 1
+        _trace.elapsed += time.perf_counter() - start
     return D
 
 if __name__ == "__main__":
@@ -84,6 +167,16 @@ if __name__ == "__main__":
     phi = 42 # angle of response
     SF = 1.5 # safety factor
     
-    ans = riprapCSU(b, Q, S, phi, theta, SG, SF, SIunits)
+    ans = riprapCSU(b, Q, S, phi, theta, SG, SF, SIunits, disp=1)
+    
+    print("\nSOLUTION:\nThe riprap size is: {:-8.4f}".format(ans))
+
+    # Quiet run, the last iterations are kept in a trace
+    trace = Trace(RIPRAP_FIELDS, size=5)
+    riprapCSU(b, Q, S, phi, theta, SG, SF, SIunits, trace=trace)
+    print(trace)
+    trace.show()
     
-    print("\nSOLUTION:\nThe riprap size is: {:-8.4f}".format(ans))
\ No newline at end of file
+    # Exact solution for several slopes at once
+    res = riprap_size(b, Q, [0.02, 0.05, 0.1], phi, theta, SG, SF, SIunits)
+    print("\nD50 for several slopes: {0}".format(np.round(res['D50'], 4)))
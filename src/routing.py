@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+routing.py
+Flow routing through channel reaches with the Muskingum and Muskingum-Cunge
+methods
+
+The Muskingum equation O[t] = C0*I[t] + C1*I[t-1] + C2*O[t-1] is a linear
+recurrence, evaluated for whole hydrographs (and many reaches at once) with
+a prefix scan instead of a loop over the time steps.
+
+@author: eduardo
+"""
+import numpy as np
+from manning import manningQ
+from channel import normal_depth
+
+def muskingum_coefficients(K, X, dt):
+    """
+    Routing coefficients of the Muskingum method. To avoid negative
+    coefficients the time step should be 2KX <= dt <= 2K(1-X).
+
+    Parameters
+    ----------
+    K : float or array_like
+        Storage constant (travel time), same units as dt.
+    X : float or array_like
+        Weighting factor, 0 to 0.5.
+    dt : float
+        Time step.
+
+    Returns
+    -------
+    C0, C1, C2 : float or ndarray
+        The coefficients, C0 + C1 + C2 = 1.
+
+    """
+    K = np.asarray(K, dtype=float)
+    X = np.asarray(X, dtype=float)
+    den = 2. * K * (1. - X) + dt
+    C0 = (dt - 2. * K * X) / den
+    C1 = (dt + 2. * K * X) / den
+    C2 = (2. * K * (1. - X) - dt) / den
+    return C0[()], C1[()], C2[()]
+
+def linear_recurrence(u, a):
+    """
+    Solves x[t] = a * x[t-1] + u[t] along the last axis, with x[0] = u[0].
+    Uses a prefix scan with log2(steps) vectorized passes.
+
+    Parameters
+    ----------
+    u : array_like
+        Input series, shape (..., steps).
+    a : float or array_like
+        Coefficient, broadcast against u[..., 0].
+
+    Returns
+    -------
+    ndarray
+        The series x.
+
+    """
+    x = np.array(u, dtype=float)
+    a = np.asarray(a, dtype=float)[..., None]
+    power = a  # a^d for the current distance d
+    d = 1
+    while d < x.shape[-1]:
+        x[..., d:] = x[..., d:] + power * x[..., :-d]
+        power = power * power
+        d *= 2
+    return x
+
+def muskingum(inflow, K, X, dt, initial=None):
+    """
+    Routes inflow hydrographs through reaches with the Muskingum method.
+
+    Parameters
+    ----------
+    inflow : array_like
+        Inflow hydrograph, shape (steps,) or (reaches, steps).
+    K, X : float or array_like
+        Muskingum parameters of each reach.
+    dt : float
+        Time step, same units as K.
+    initial : float or array_like, optional
+        Initial outflow. The default is the initial inflow.
+
+    Returns
+    -------
+    ndarray
+        Outflow hydrographs with the shape of the inflow.
+
+    """
+    I = np.asarray(inflow, dtype=float)
+    C0, C1, C2 = muskingum_coefficients(K, X, dt)
+    C0, C1, C2 = [np.asarray(c)[..., None] for c in (C0, C1, C2)]
+    u = np.empty(np.broadcast(I, C0).shape)
+    u[..., 1:] = C0 * I[..., 1:] + C1 * I[..., :-1]
+    u[..., 0] = I[..., 0] if initial is None else initial
+    return linear_recurrence(u, C2[..., 0])
+
+def cunge_parameters(section, n, S, Qref, dx, dt=None, SI=True):
+    """
+    Parameters K and X of the Muskingum-Cunge method from the geometry of
+    the channel at a reference discharge. Section parameters and n, S,
+    Qref, dx can be arrays, one value per reach.
+
+    Parameters
+    ----------
+    section : object
+        A cross section from manning.py with setDepth, e.g. Trapezoidal.
+    n : float or array_like
+        Manning roughness coefficient.
+    S : float or array_like
+        Channel slope.
+    Qref : float or array_like
+        Reference discharge, e.g. the average of base and peak flow.
+    dx : float or array_like
+        Length of the reach.
+    dt : float, optional
+        Time step, to convert K to time step units. The default is None,
+        K in seconds.
+    SI : boolean, optional
+        True for SI units, False for US customary units. The default is True.
+
+    Returns
+    -------
+    K : float or ndarray
+        Storage constant, seconds (or time steps if dt is given).
+    X : float or ndarray
+        Weighting factor.
+    c : float or ndarray
+        Wave celerity.
+
+    """
+    y, info = normal_depth(n, S, Qref, section, SI)
+    # Celerity c = dQ/dA with a centered difference around the normal depth
+    h = 1E-4 * y
+    section.setDepth(y + h)
+    Q2, A2 = manningQ(n, section.getArea(), section.getHydraulicRadius(), S, SI), section.getArea()
+    section.setDepth(y - h)
+    Q1, A1 = manningQ(n, section.getArea(), section.getHydraulicRadius(), S, SI), section.getArea()
+    section.setDepth(y)
+    c = (Q2 - Q1) / (A2 - A1)
+    T = section.getTopWidth()
+
+    K = np.asarray(dx, dtype=float) / c
+    X = 0.5 * (1. - np.asarray(Qref, dtype=float) / (T * np.asarray(S) * c * np.asarray(dx)))
+    if dt is not None:
+        K = K / dt
+    return K[()], X[()], c[()]
+
+def route_network(inflow, downstream, K, X, dt):
+    """
+    Routes hydrographs through a network of reaches. The reaches at the same
+    distance from the headwaters are routed together in one batch.
+
+    Parameters
+    ----------
+    inflow : array_like
+        Local inflow at the upstream end of each reach, shape (reaches, steps).
+    downstream : array_like
+        Index of the reach that receives the outflow of each reach, -1 for
+        the outlet. Reaches are topologically sorted: a reach is listed
+        before the reach downstream.
+    K, X : array_like
+        Muskingum parameters of each reach.
+    dt : float
+        Time step, same units as K.
+
+    Returns
+    -------
+    ndarray
+        Outflow hydrograph of each reach, shape (reaches, steps).
+
+    """
+    I = np.array(inflow, dtype=float)
+    downstream = np.asarray(downstream, dtype=int)
+    nreach = len(downstream)
+    K = np.broadcast_to(np.asarray(K, dtype=float), (nreach,))
+    X = np.broadcast_to(np.asarray(X, dtype=float), (nreach,))
+    assert np.all((downstream == -1) | (downstream > np.arange(nreach))), \
+        'Reaches should be topologically sorted'
+
+    # Level of each reach, the longest path from a headwater reach
+    level = np.zeros(nreach, dtype=int)
+    for r in range(nreach):
+        if downstream[r] >= 0:
+            level[downstream[r]] = max(level[downstream[r]], level[r] + 1)
+
+    outflow = np.empty_like(I)
+    for l in range(level.max() + 1):
+        batch = np.flatnonzero(level == l)
+        outflow[batch] = muskingum(I[batch], K[batch], X[batch], dt)
+        # Add the outflow to the inflow of the reaches downstream
+        receiving = downstream[batch] >= 0
+        np.add.at(I, downstream[batch[receiving]], outflow[batch[receiving]])
+    return outflow
+
+if __name__ == "__main__":
+    from manning import Trapezoidal
+
+    # Triangular inflow hydrograph, cms every 30 min
+    dt = 1800.
+    t = np.arange(100) * dt / 3600.
+    inflow = 10. + np.interp(t, [0, 6, 18], [0, 90, 0])
+
+    # Muskingum-Cunge parameters for three reaches
+    section = Trapezoidal([5., 8., 12.], 2., 1.)
+    K, X, c = cunge_parameters(section, 0.035, 0.002, 50., 5000., dt)
+    print("K (steps): {0}".format(np.round(K, 4)))
+    print("X:         {0}".format(np.round(X, 4)))
+
+    # Two tributaries join the main reach
+    local = np.vstack([inflow, 0.5 * inflow, np.zeros_like(inflow)])
+    out = route_network(local, [2, 2, -1], K, X, 1.)
+    print("Peak inflow:  {:-8.4f}".format(inflow.max()))
+    print("Peak outflow: {:-8.4f} at {:.1f} hr".format(out[2].max(), t[out[2].argmax()]))
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+sensitivity.py
+Uncertainty and sensitivity analysis of the hydraulic design functions
+
+The parameters are given as distributions and sampled with Latin hypercube
+sampling. Models are evaluated with their vectorized paths by chunks of
+samples, so the memory stays bounded for millions of samples, and every
+chunk has its own random stream derived from the seed, which makes the
+results reproducible.
+
+Parameters are given in a dict, e.g. {'n': ('uniform', 0.02, 0.03),
+'S': ('normal', 0.001, 0.0001), 'SI': True}. Supported distributions:
+    ('uniform', low, high)
+    ('normal', mean, sd)
+    ('lognormal', mean, sigma), of the underlying normal distribution
+    ('triangular', low, mode, high)
+Any other value is passed to the model unchanged.
+
+@author: eduardo
+"""
+import numpy as np
+from manning import manningQ, Trapezoidal
+from channel import normal_depth_batch
+from riprap import riprap_size
+from lateral import design_laterals
+
+DISTRIBUTIONS = ['uniform', 'normal', 'lognormal', 'triangular']
+
+def norm_ppf(p):
+    """ Inverse of the standard normal distribution, rational approximation
+    of P. J. Acklam with relative error below 1.2E-9 """
+    a = [-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02,
+         1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00]
+    b = [-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02,
+         6.680131188771972e+01, -1.328068155288572e+01]
+    c = [-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,
+         -2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00]
+    d = [7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00,
+         3.754408661907416e+00]
+    p = np.asarray(p, dtype=float)
+    # Central region, then the tails with the symmetric formula
+    q = p - 0.5
+    r = q * q
+    x = (((((a[0]*r + a[1])*r + a[2])*r + a[3])*r + a[4])*r + a[5]) * q / \
+        (((((b[0]*r + b[1])*r + b[2])*r + b[3])*r + b[4])*r + 1.)
+    tail = np.abs(q) > 0.47575
+    if tail.any():
+        pt = np.minimum(p[tail], 1. - p[tail])
+        s = np.sqrt(-2. * np.log(pt))
+        xt = (((((c[0]*s + c[1])*s + c[2])*s + c[3])*s + c[4])*s + c[5]) / \
+             ((((d[0]*s + d[1])*s + d[2])*s + d[3])*s + 1.)
+        x[tail] = np.where(q[tail] < 0, xt, -xt)
+    return x[()]
+
+def latin_hypercube(nsamples, nparams, rng):
+    """ Latin hypercube sample in the unit hypercube, shape (nsamples,
+    nparams): one value in each of the nsamples strata of every parameter """
+    strata = rng.permuted(np.tile(np.arange(nsamples), (nparams, 1)), axis=1).T
+    return (strata + rng.random((nsamples, nparams))) / nsamples
+
+def transform(u, dist):
+    """ Values of a distribution for probabilities u (inverse CDF) """
+    name, args = dist[0], dist[1:]
+    assert name in DISTRIBUTIONS, "Unknown distribution '{0}'".format(name)
+    if name == 'uniform':
+        low, high = args
+        return low + u * (high - low)
+    if name == 'normal':
+        mean, sd = args
+        return mean + sd * norm_ppf(u)
+    if name == 'lognormal':
+        mean, sigma = args
+        return np.exp(mean + sigma * norm_ppf(u))
+    low, mode, high = args
+    fc = (mode - low) / (high - low)
+    return np.where(u < fc, low + np.sqrt(u * (high - low) * (mode - low)),
+                    high - np.sqrt((1. - u) * (high - low) * (high - mode)))
+
+def _split(params):
+    """ Names of the parameters with a distribution and the constant ones """
+    random = [k for k, v in params.items()
+              if isinstance(v, tuple) and len(v) and v[0] in DISTRIBUTIONS]
+    fixed = {k: v for k, v in params.items() if k not in random}
+    return random, fixed
+
+def _chunks(nsamples, chunksize, seed):
+    """ Size and random generator of every chunk, reproducible for a seed """
+    sizes = [min(chunksize, nsamples - i) for i in range(0, nsamples, chunksize)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    return [(size, np.random.default_rng(s)) for size, s in zip(sizes, seeds)]
+
+def _evaluate(model, names, values, fixed):
+    """ Evaluates the model with the columns of values as parameters """
+    kwargs = dict(fixed)
+    kwargs.update({name: values[:, j] for j, name in enumerate(names)})
+    return np.asarray(model(**kwargs), dtype=float)
+
+def sample(params, nsamples, seed=None, chunksize=100000):
+    """
+    Latin hypercube samples of the parameters by chunks.
+
+    Parameters
+    ----------
+    params : dict
+        Distributions (or constant values) of the parameters.
+    nsamples : int
+        Total number of samples.
+    seed : int, optional
+        Seed of the random stream. The default is None.
+    chunksize : int, optional
+        Number of samples of each chunk, every chunk is a Latin hypercube.
+        The default is 100000.
+
+    Yields
+    ------
+    dict
+        Arrays of the sampled parameters of a chunk, and the constant ones.
+
+    """
+    names, fixed = _split(params)
+    for size, rng in _chunks(nsamples, chunksize, seed):
+        u = latin_hypercube(size, len(names), rng)
+        chunk = dict(fixed)
+        chunk.update({k: transform(u[:, j], params[k]) for j, k in enumerate(names)})
+        yield chunk
+
+def run(model, params, nsamples, seed=None, chunksize=100000):
+    """
+    Uncertainty analysis: evaluates a model for the samples of the parameters.
+
+    Parameters
+    ----------
+    model : callable
+        Vectorized function of the parameters (as keywords), e.g. one of
+        MODELS, returning one value per sample.
+    params, nsamples, seed, chunksize
+        See sample.
+
+    Returns
+    -------
+    ndarray
+        The output of every sample.
+
+    """
+    return np.concatenate([np.asarray(model(**chunk), dtype=float)
+                           for chunk in sample(params, nsamples, seed, chunksize)])
+
+def summary(output, quantiles=(0.05, 0.25, 0.5, 0.75, 0.95)):
+    """ Statistics of the output of run, NaN values (failed designs) are
+    counted and excluded """
+    import pandas as pd  # imported only when the results are tabulated
+    valid = output[~np.isnan(output)]
+    stats = {'samples': len(output), 'failed': len(output) - len(valid),
+             'mean': valid.mean(), 'std': valid.std()}
+    stats.update({'q{0:g}'.format(100 * q): v
+                  for q, v in zip(quantiles, np.quantile(valid, quantiles))})
+    return pd.Series(stats)
+
+def sobol(model, params, nsamples, seed=None, chunksize=10000):
+    """
+    First order and total Sobol indices with the estimators of Saltelli
+    (2010) and Jansen. Requires nsamples * (k + 2) model evaluations for k
+    parameters with a distribution.
+
+    Parameters
+    ----------
+    model : callable
+        Vectorized function of the parameters, see run.
+    params, nsamples, seed, chunksize
+        See sample. Each chunk evaluates chunksize * (k + 2) samples.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Columns 'S1' and 'ST' for every parameter with a distribution.
+        Samples where the model returns NaN are ignored.
+
+    """
+    import pandas as pd
+    names, fixed = _split(params)
+    k = len(names)
+    n, shift = 0, None
+    sum_f = sum_f2 = 0.
+    sum_first = np.zeros(k)
+    sum_total = np.zeros(k)
+    for size, rng in _chunks(nsamples, chunksize, seed):
+        # Two independent matrices A and B, then A with column i from B
+        u = latin_hypercube(size, 2 * k, rng)
+        x = np.column_stack([transform(u[:, j], params[names[j % k]]) for j in range(2 * k)])
+        A, B = x[:, :k], x[:, k:]
+        AB = np.tile(A, (k, 1))
+        for i in range(k):
+            AB[i * size:(i + 1) * size, i] = B[:, i]
+        f = _evaluate(model, names, np.vstack((A, B, AB)), fixed)
+        fA, fB, fAB = f[:size], f[size:2 * size], f[2 * size:].reshape(k, size)
+
+        valid = ~(np.isnan(fA) | np.isnan(fB) | np.isnan(fAB).any(axis=0))
+        fA, fB, fAB = fA[valid], fB[valid], fAB[:, valid]
+        if shift is None and valid.any():
+            shift = np.mean(fA)  # better precision of the sums of squares
+        fA, fB, fAB = fA - shift, fB - shift, fAB - shift
+        n += valid.sum()
+        sum_f += fA.sum() + fB.sum()
+        sum_f2 += (fA * fA).sum() + (fB * fB).sum()
+        sum_first += (fB * (fAB - fA)).sum(axis=1)
+        sum_total += ((fA - fAB)**2).sum(axis=1)
+
+    mean = sum_f / (2 * n)
+    var = sum_f2 / (2 * n) - mean * mean
+    return pd.DataFrame({'S1': sum_first / n / var,
+                         'ST': sum_total / (2 * n) / var}, index=names)
+
+def morris(model, params, trajectories, levels=4, seed=None, chunksize=1000):
+    """
+    Elementary effects screening method of Morris. Requires trajectories *
+    (k + 1) model evaluations for k parameters with a distribution.
+
+    Parameters
+    ----------
+    model : callable
+        Vectorized function of the parameters, see run.
+    params : dict
+        Distributions (or constant values) of the parameters.
+    trajectories : int
+        Number of trajectories (one-at-a-time designs).
+    levels : int, optional
+        Number of levels of the grid, even. The default is 4.
+    seed : int, optional
+        Seed of the random stream. The default is None.
+    chunksize : int, optional
+        Number of trajectories evaluated at once. The default is 1000.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Columns 'mu', 'mu_star' (mean of the absolute effects) and 'sigma'
+        for every parameter with a distribution, the effects are per unit
+        of probability of the parameters.
+
+    """
+    import pandas as pd
+    names, fixed = _split(params)
+    k = len(names)
+    delta = levels / (2. * (levels - 1))
+    effects = [[] for i in range(k)]
+    for size, rng in _chunks(trajectories, chunksize, seed):
+        # Base points on the grid such that x + delta <= 1
+        base = rng.integers(0, levels // 2, (size, k)) / (levels - 1.)
+        order = np.argsort(rng.random((size, k)), axis=1)
+        # Point j of a trajectory has the first j parameters of order increased
+        steps = np.zeros((size, k + 1, k))
+        rows = np.arange(size)
+        for j in range(k):
+            steps[:, j + 1] = steps[:, j]
+            steps[rows, j + 1, order[:, j]] = delta
+        u = base[:, None, :] + steps
+        # Grid ends are 0 and 1, shrink them to valid probabilities
+        u = (u * (levels - 1) + 0.5) / levels
+        x = np.column_stack([transform(u[..., j].ravel(), params[names[j]]) for j in range(k)])
+        f = _evaluate(model, names, x, fixed).reshape(size, k + 1)
+        ee = np.diff(f, axis=1) / (delta * (levels - 1) / levels)
+        for j in range(k):
+            effects[j].append(ee[rows, np.argmax(order == j, axis=1)])
+
+    effects = [np.concatenate(e) for e in effects]
+    return pd.DataFrame({'mu': [np.nanmean(e) for e in effects],
+                         'mu_star': [np.nanmean(np.abs(e)) for e in effects],
+                         'sigma': [np.nanstd(e) for e in effects]}, index=names)
+
+def _manningQ(n, S, B, z, y, SI=True):
+    section = Trapezoidal(B, z, y)
+    return manningQ(n, section.getArea(), section.getHydraulicRadius(), S, SI)
+
+def _normal_depth(n, S, Q, B=0., z=0., SI=True):
+    y, info = normal_depth_batch(n, S, Q, B, z, SI)
+    return np.where(info['converged'], y, np.nan)
+
+def _riprap(b, Q, S, phi, theta, SG, SF=1.5, SI=True):
+    return riprap_size(b, Q, S, phi, theta, SG, SF, SI)['D50']
+
+def _lateral(**fields):
+    size = max(np.size(v) for v in fields.values())
+    fields = {k: np.broadcast_to(v, (size,)) for k, v in fields.items()}
+    return design_laterals(fields)['pressure'].to_numpy()
+
+# Vectorized models: discharge of a trapezoidal channel, normal depth of the
+# channel design, riprap D50 and inlet pressure of a sprinkler lateral
+MODELS = {'manningQ': _manningQ,
+          'design_channel': _normal_depth,
+          'riprap': _riprap,
+          'lateral': _lateral}
+
+if __name__ == "__main__":
+    # Uncertainty of the normal depth of a trapezoidal channel design
+    params = {'n': ('triangular', 0.025, 0.03, 0.04),
+              'S': ('normal', 0.001, 0.0001),
+              'Q': ('lognormal', np.log(10.), 0.2),
+              'B': 3.,
+              'z': ('uniform', 1., 2.)}
+    y = run(MODELS['design_channel'], params, 100000, seed=42)
+    print("Normal depth (m)\n{0}\n".format(summary(y).round(4)))
+    print("Sobol indices\n{0}\n".format(sobol(MODELS['design_channel'], params, 20000, seed=42).round(4)))
+
+    # Screening of the riprap size parameters
+    params = {'b': 6., 'Q': ('uniform', 5., 15.), 'S': ('uniform', 0.005, 0.02),
+              'phi': ('uniform', 38., 42.), 'theta': ('uniform', 15., 20.),
+              'SG': ('normal', 2.65, 0.05)}
+    print("Morris elementary effects\n{0}".format(morris(MODELS['riprap'], params, 500, seed=42).round(4)))
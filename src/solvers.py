@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+solvers.py
+Bracketed root finding for arrays of equations
+
+The functions solve f(x) = 0 element-wise, so a single call finds the roots
+of thousands of independent equations (e.g. normal depth of many channels).
+
+@author: eduardo
+"""
+import numpy as np
+
+def expand_bracket(f, a, b, fa=None, fb=None, grow=2., max_iter=60):
+    """
+    Moves the upper limit b until f(a) and f(b) have opposite signs. The
+    function f should be increasing, e.g. discharge minus design discharge
+    as a function of depth.
+
+    Parameters
+    ----------
+    f : callable
+        Vectorized function, f(x) returns an array with the shape of x.
+    a : float or array_like
+        Lower limit, f(a) should be negative.
+    b : float or array_like
+        Initial guess of the upper limit.
+    fa : array_like, optional
+        The value of f(a) if already known (e.g. f is undefined at a = 0).
+    fb : array_like, optional
+        The value of f(b) if already known.
+    grow : float, optional
+        Factor to enlarge the upper limit. The default is 2.
+    max_iter : int, optional
+        Maximum number of enlargements. The default is 60.
+
+    Returns
+    -------
+    a, b, fa, fb : ndarray
+        The bracket and the values of the function at its limits.
+    evals : int
+        Number of function evaluations.
+
+    """
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    evals = 0
+    if fa is None:
+        fa = f(a)
+        evals += 1
+    if fb is None:
+        fb = f(b)
+        evals += 1
+    a, b, fa, fb = [np.array(v, dtype=float) for v in
+                    np.broadcast_arrays(a, b, fa, fb)]
+    for _ in range(max_iter):
+        low = fb < 0
+        if not low.any():
+            break
+        # Move the lower limit up, the root is above the current b
+        a = np.where(low, b, a)
+        fa = np.where(low, fb, fa)
+        b = np.where(low, b * grow, b)
+        fb = np.where(low, f(b), fb)
+        evals += 1
+    return a, b, fa, fb, evals
+
+def find_root(f, a, b, fa=None, fb=None, **kwargs):
+    """
+    Finds the roots of f(x) = 0 inside the brackets [a, b] using the
+    Anderson-Bjorck variant of the regula falsi (false position) method,
+    falling back to bisection when the interpolation leaves the bracket.
+
+    Parameters
+    ----------
+    f : callable
+        Vectorized function, f(x) returns an array with the shape of x.
+    a, b : float or array_like
+        Limits of the brackets, f(a) and f(b) should have opposite signs.
+    fa, fb : array_like, optional
+        Values of the function at the limits if already known.
+    xtol : float, optional
+        Tolerance on the width of the bracket. The default is 1E-10.
+    ftol : float, optional
+        Tolerance on the value of the function |f(x)|. The default is 0.
+    max_iter : int, optional
+        Maximum number of iterations. The default is 100.
+    callback : callable, optional
+        Called after every iteration as callback(i, x, fx).
+
+    Returns
+    -------
+    x : float or ndarray
+        The roots, a scalar when the limits are scalars.
+    info : dict
+        Convergence diagnostics: 'converged' (bool array), 'iterations',
+        'evaluations' and 'residual' (f evaluated at the roots).
+
+    """
+    _xtol = kwargs.get('xtol', 1E-10)
+    _ftol = kwargs.get('ftol', 0.)
+    _max_iter = kwargs.get('max_iter', 100)
+    _callback = kwargs.get('callback', None)
+
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    evals = 0
+    if fa is None:
+        fa = f(a)
+        evals += 1
+    if fb is None:
+        fb = f(b)
+        evals += 1
+    a, b, fa, fb = np.broadcast_arrays(a, b, fa, fb)
+    scalar = (a.ndim == 0)
+    a, b, fa, fb = [np.array(v, dtype=float, ndmin=1) for v in (a, b, fa, fb)]
+
+    # Start from the limit closest to zero, roots at the limits are done
+    x = np.where(np.abs(fa) < np.abs(fb), a, b)
+    fx = np.where(np.abs(fa) < np.abs(fb), fa, fb)
+    done = (fa == 0) | (fb == 0) | (np.abs(fx) <= _ftol) | (np.abs(b - a) <= _xtol)
+    assert np.all(done | (np.sign(fa) != np.sign(fb))), 'Root is not bracketed'
+
+    i = 0
+    while not done.all() and i < _max_iter:
+        i += 1
+        # False position step, bisection when it falls outside the bracket
+        with np.errstate(divide='ignore', invalid='ignore'):
+            c = b - fb * (b - a) / (fb - fa)
+        lo, hi = np.minimum(a, b), np.maximum(a, b)
+        bad = ~np.isfinite(c) | (c <= lo) | (c >= hi)
+        c = np.where(bad, 0.5 * (a + b), c)
+        c = np.where(done, x, c)
+        fc = f(c)
+        evals += 1
+
+        # Keep the root bracketed between a and the newest point b
+        opposite = np.sign(fc) != np.sign(fb)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            m = 1. - fc / fb
+        m = np.where(m > 0, m, 0.5)
+        new_a = np.where(opposite, b, a)
+        new_fa = np.where(opposite, fb, fa * m)
+        a = np.where(done, a, new_a)
+        fa = np.where(done, fa, new_fa)
+        b = np.where(done, b, c)
+        fb = np.where(done, fb, fc)
+        x = np.where(done, x, c)
+        fx = np.where(done, fx, fc)
+
+        done = done | (fc == 0) | (np.abs(fx) <= _ftol) | (np.abs(b - a) <= _xtol)
+        if _callback is not None:
+            _callback(i, x[0] if scalar else x, fx[0] if scalar else fx)
+
+    if scalar:
+        x, fx, done = x[0], fx[0], bool(done[0])
+    info = {'converged': done,
+            'iterations': i,
+            'evaluations': evals,
+            'residual': fx}
+    return x, info
+
+class Trace:
+    """ Trace
+
+    Records the iterations of a solver in a preallocated ring buffer, so the
+    iterations can be inspected or exported after the run without printing
+    inside the loop. Only the last 'size' iterations are kept. The counters
+    of iterations, function evaluations and wall time are set by the solver.
+    """
+    def __init__(self, fields, size=1000):
+        """
+        Parameters
+        ----------
+        fields : list
+            Names of the recorded values, e.g. CHANNEL_FIELDS.
+        size : int, optional
+            Number of iterations kept. The default is 1000.
+
+        Returns
+        -------
+        None.
+
+        """
+        assert size > 0, 'The size should be positive'
+        self.fields = tuple(fields)
+        self.size = size
+        self.buffer = np.zeros(size, dtype=[(field, float) for field in self.fields])
+        self.count = 0  # rows recorded, including the overwritten ones
+        self.iterations = 0
+        self.evaluations = 0
+        self.elapsed = 0.  # wall time in seconds
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    def __str__(self):
+        text = '\nSOLVER TRACE\n'
+        text += 'Iterations:    {0}\n'.format(self.iterations)
+        text += 'Evaluations:   {0}\n'.format(self.evaluations)
+        text += 'Wall time:     {0:.6f} [s]\n'.format(self.elapsed)
+        text += 'Rows kept:     {0} of {1}\n'.format(len(self), self.count)
+        return text
+
+    def record(self, *values):
+        """ Adds a row with one value per field, overwrites the oldest one
+        when the buffer is full """
+        self.buffer[self.count % self.size] = values
+        self.count += 1
+
+    def clear(self):
+        """ Removes the rows and resets the counters """
+        self.count = 0
+        self.iterations = 0
+        self.evaluations = 0
+        self.elapsed = 0.
+
+    def to_array(self):
+        """ The rows kept as a structured array, oldest first """
+        if self.count <= self.size:
+            return self.buffer[:self.count].copy()
+        return np.roll(self.buffer, -(self.count % self.size))
+
+    def to_frame(self):
+        """ The rows kept as a pandas Data Frame """
+        import pandas as pd
+        return pd.DataFrame(self.to_array())
+
+    def save(self, filename):
+        """ Exports the rows kept to a CSV file """
+        np.savetxt(filename, self.to_array(), delimiter=',', fmt='%.10g',
+                   header=','.join(self.fields), comments='')
+
+    def show(self, fmt='{:-10.4f}'):
+        """ Prints the rows kept as a table """
+        print(''.join('{:>10}'.format(field) for field in self.fields))
+        for row in self.to_array():
+            print(''.join(fmt.format(value) for value in row))
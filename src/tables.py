@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tables.py
+Hydraulic property tables of channel cross sections
+
+The geometric properties of a section are computed once on a dense grid of
+depths, then the properties at any depth (or the depth for a given value of
+a property) are obtained by linear interpolation, which is much faster than
+evaluating the section again. Tables are cached per section and can be
+saved to disk.
+
+@author: eduardo
+"""
+from collections import OrderedDict
+import numpy as np
+
+# Properties of the tables
+PROPERTIES = ['area', 'perimeter', 'radius', 'top_width', 'conveyance', 'section_factor']
+
+# Tables already computed, the least recently used ones are dropped when
+# there are more than MAX_TABLES, see get_table
+MAX_TABLES = 256
+_tables = OrderedDict()
+
+class HydraulicTable:
+
+    def __init__(self, section, depth_max, n=1., SI=True, npoints=500):
+        """
+        Parameters
+        ----------
+        section : object
+            A cross section from manning.py with setDepth, e.g. Trapezoidal.
+            None creates an empty table, used by load_table.
+        depth_max : float
+            Maximum depth of the table.
+        n : float, optional
+            Manning roughness coefficient, used for the conveyance.
+            The default is 1.
+        SI : boolean, optional
+            True for SI units, False for US customary units. The default is True.
+        npoints : int, optional
+            Number of depths of the table. The default is 500.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.n = n
+        self.SI = SI
+        self.depth = np.linspace(0., depth_max, npoints)
+        if section is None:
+            return
+
+        # Evaluate the section for all the depths at once, depth 0 is empty
+        y = section.y
+        section.setDepth(self.depth[1:])
+        self.area = np.concatenate(([0.], section.getArea()))
+        self.perimeter = np.concatenate(([0.], section.getWettedPerimeter()))
+        self.radius = np.concatenate(([0.], section.getHydraulicRadius()))
+        self.top_width = np.concatenate(([0.], section.getTopWidth()))
+
+        # Conveyance, Q = K * sqrt(S), sections with zones of different
+        # roughness (NaturalSection) compute their own composite conveyance
+        if getattr(section, 'n', None) is not None and hasattr(section, 'getConveyance'):
+            self.conveyance = np.concatenate(([0.], section.getConveyance(SI)))
+        else:
+            k = 1. if SI else 1.486
+            self.conveyance = (k / n) * self.area * np.power(self.radius, 2/3.)
+        section.setDepth(y)
+        # Section factor for critical flow, Z = A * sqrt(A / T)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.section_factor = np.nan_to_num(self.area * np.sqrt(self.area / self.top_width),
+                                                nan=0., posinf=np.inf)
+
+    def get(self, prop, y):
+        """ Interpolates a property (see PROPERTIES) at the depths y """
+        assert prop in PROPERTIES, "Unknown property '{0}'".format(prop)
+        return np.interp(y, self.depth, getattr(self, prop))[()]
+
+    def depth_from(self, prop, value):
+        """ Depths for values of a property (e.g. 'conveyance'), the inverse
+        query. Only the increasing part of the property is used, e.g. for a
+        circular conduit the conveyance decreases near the crown """
+        assert prop in PROPERTIES, "Unknown property '{0}'".format(prop)
+        values = getattr(self, prop)
+        falling = np.flatnonzero(np.diff(values) <= 0)
+        last = falling[0] + 1 if len(falling) else len(values)
+        return np.interp(value, values[:last], self.depth[:last], right=np.nan)[()]
+
+    def depth_from_discharge(self, Q, S):
+        """ Normal depth for discharges Q and slopes S, from the conveyance """
+        return self.depth_from('conveyance', np.asarray(Q) / np.sqrt(S))
+
+    def save(self, filename):
+        """ Saves the table to a NumPy .npz file """
+        np.savez(filename, depth=self.depth, n=self.n, SI=self.SI,
+                 **{prop: getattr(self, prop) for prop in PROPERTIES})
+
+def load_table(filename):
+    """ Reads a table saved with HydraulicTable.save """
+    with np.load(filename) as f:
+        table = HydraulicTable(None, f['depth'][-1], float(f['n']), bool(f['SI']), len(f['depth']))
+        for prop in PROPERTIES:
+            setattr(table, prop, f[prop])
+    return table
+
+def _param_key(value):
+    """ Hashable key of a section parameter, equal values of different type
+    or shape have different keys """
+    value = np.asarray(value)
+    return (value.dtype.str, value.shape, value.tobytes())
+
+def get_table(section, depth_max, n=1., SI=True, npoints=500):
+    """ Returns the table of a section, computed only the first time for
+    the same type of section, parameters, roughness and depths. Attributes
+    that change with the depth (y, theta and private ones) are not compared """
+    params = tuple((k, _param_key(v)) for k, v in sorted(vars(section).items())
+                   if k not in ('y', 'theta') and not k.startswith('_'))
+    key = (type(section).__name__, params, n, SI, depth_max, npoints)
+    if key in _tables:
+        _tables.move_to_end(key)
+    else:
+        _tables[key] = HydraulicTable(section, depth_max, n, SI, npoints)
+        if len(_tables) > MAX_TABLES:
+            _tables.popitem(last=False)
+    return _tables[key]
+
+def clear_tables():
+    """ Removes all the tables cached by get_table """
+    _tables.clear()
@@ -7,12 +7,47 @@ Data retrieval from automatic weather stations
 Created on Sat Mar  6 15:42:10 2021
 @author: eduardo
 """
-import requests
-import urllib.request, urllib.error
+import io
+import time
+import threading
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 from datetime import timedelta, datetime
+from concurrent.futures import ThreadPoolExecutor
+from azmet import read_raw, datetime_index
+from plotting import pyplot, show
+import registry
+from registry import DAYTIME_HOURS_FILE, read_daytime_hours, daytime_hours_array
+
+# Aggregation of the hourly variables to daily values, one or several rules
+# per column as in pandas.DataFrame.agg, 'circmean' is the mean of angles
+HOURLY_RULES = {
+    'Air Temperature': ['mean', 'min', 'max'],
+    'Rel. Humidity': ['mean', 'min', 'max'],
+    'Vapor Pressure Deficit': 'mean',
+    'Solar Radiation': 'sum',
+    'Precipitation': 'sum',
+    '4" Soil Temperature  ( = 2" prior to 1999 )': ['mean', 'min', 'max'],
+    '20" Soil Temperature  ( = 4" prior to 1999 )': ['mean', 'min', 'max'],
+    'Wind Speed (Ave)': 'mean',
+    'Wind Vector Magnitude': 'mean',
+    'Wind Vector Direction': 'circmean',
+    'Wind Direction Standard Deviation': 'mean',
+    'Max Wind Speed': 'max',
+    'Reference Evapotranspiration (ETo) - Original AZMET': 'sum',
+    "Actual Vapor Pressure       'New' : 2003 to Present": 'mean',
+    "Dewpoint, Hourly Average    'New' : 2003 to Present": 'mean',
+}
+
+def create_session(pool_size=16):
+    """ Creates a HTTP session that reuses up to pool_size connections """
+    import requests  # imported only when data is downloaded
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({"User-Agent":"Mozilla/5.0"})
+    return session
 
 class WeatherData:
 
@@ -26,18 +61,29 @@ class WeatherData:
         self.timestep = timestep
         
         self.station_id = '--'
+        self.base_url = 'https://cals.arizona.edu/azmet/data/'
+        self.cache = None  # no local cache of the annual files
+        self.session = None  # HTTP session, created when first needed
+        self.session_lock = threading.Lock()  # the threads create only one session
+        self.archive = None  # no local columnar archive
+        self.workers = 8  # number of files retrieved at the same time
+        self.retries = 3  # download attempts after a failed one
+        self.backoff = 0.5  # seconds to wait before the first retry
         self.period = 1  # initialize with a period of 1 day
         self.years = []
         self.data = pd.DataFrame()
         
-        self.locations = self.read_values('../doc/AZ_locations')
+        # Station names and column headers are read once per process
+        self.locations = registry.stations()
         self.weather_station_id()
-        # Check whether 'daily' or 'hourly' data
-        # self.headerfile = '../doc/vars_daily'  if self.timestep == 'daily' else '../doc/vars_hourly'
-        # Use short column header
-        self.headerfile = '../doc/vars_daily_short'  if self.timestep == 'daily' else '../doc/vars_hourly'
+        # Check whether 'daily' or 'hourly' data, daily uses short column headers
+        self.headerfile = registry.HEADER_FILES['daily' if self.timestep == 'daily' else 'hourly']
         self.dtype = 'rd' if self.timestep == 'daily' else 'rh'  # rh: raw daily, rh: raw hourly
-        self.headers = self.read_values(self.headerfile)
+        # Columns of the raw files, not changed when columns are added
+        self.raw_headers = registry.headers('daily' if self.timestep == 'daily' else 'hourly')
+        self.headers = list(self.raw_headers)
+        # Year and day of year are the first columns of the raw files
+        self.year_col, self.doy_col = self.raw_headers[0], self.raw_headers[1]
         print('Creating weather data for {0}... successful!'.format(self.station))
     
     def __str__(self):
@@ -70,6 +116,29 @@ class WeatherData:
         """ Returns the end date as 'datetime' object"""
         return self.end_date
 
+    def set_cache(self, cache):
+        """ Sets a 'WeatherCache' object to keep the annual files on disk,
+        use None to always download the files """
+        self.cache = cache
+
+    def set_archive(self, archive):
+        """ Sets a 'WeatherArchive' object to keep the data of the complete
+        years as columnar files, use None to parse the text files always """
+        self.archive = archive
+
+    def set_session(self, session):
+        """ Sets a 'requests.Session' to share the HTTP connections """
+        self.session = session
+
+    def set_workers(self, workers):
+        """ Sets the number of files retrieved at the same time """
+        assert workers >= 1, 'At least one worker is needed'
+        self.workers = workers
+
+    def set_base_url(self, base_url):
+        """ Sets the URL of the website with the weather station files """
+        self.base_url = base_url
+
     def read_values(self, filename):
         """ Get the values from a text file, one value per line
         
@@ -84,8 +153,7 @@ class WeatherData:
 
     def weather_station_id(self):
         """ Sets a two-digit ID using the name of the weather station """
-        if self.station in self.locations:
-            self.station_id = str(self.locations.index(self.station) + 1).zfill(self.ID_PLACES)
+        self.station_id = registry.station_id(self.station, self.station_id)
 
     def create_url(self, station_id, year, dtype):
         """ Creates the URL of the website to retrieve weather data """
@@ -93,29 +161,40 @@ class WeatherData:
         assert dtype == 'rh' or dtype == 'rd', "Incorrect raw data type"
         # url: two-digit station, two-digit year, and two-char type: raw daily 'rd'
         yr = str(year)[-self.ID_PLACES:]
-        self.url = 'https://cals.arizona.edu/azmet/data/' + station_id + yr + dtype + '.txt'
+        self.url = self.base_url + station_id + yr + dtype + '.txt'
+        return self.url
+
+    def download(self, url):
+        """ Downloads a file from the website and returns its content as bytes
+        Failed connections and server errors are retried with exponential backoff """
+        import requests
+        with self.session_lock:
+            if self.session is None:
+                self.session = create_session(self.workers)
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.get(url, timeout=60)
+                if response.status_code < 500:
+                    break
+                response.raise_for_status()
+            except requests.RequestException:
+                if attempt == self.retries:
+                    raise
+            time.sleep(self.backoff * 2**attempt)
+        response.raise_for_status()
+        return response.content
 
     def get_data_url(self):
         """ Retrieves the weather station data from online website """
+        import requests
+        data = []
         try:
-            headers = {"User-Agent":"Mozilla/5.0"}
-            response = requests.get(self.url, headers=headers)  # Connect to the URL
-            ret_data = urllib.request.urlopen(self.url)  # Retrieve data from the URL
-    
-            # Print the connection status
-            # for key in response.headers.keys():
-            #     print("  {0}: {1}".format(key, response.headers[key]))
-            print("  Response status code: {0}".format(response.status_code))
-    
-            # Save all the data from the website in a list
-            data = []
-            for line in ret_data:
-                data.append(line)
-    
-        except urllib.error.URLError as e:
-            print("  Error URL:", e.reason)
-        except urllib.error.HTTPError as e:
-            print("  Error HTTP:", e.code)
+            # Save all the data from the website in a list, one line per element
+            data = self.download(self.url).splitlines(keepends=True)
+        except requests.HTTPError as e:
+            print("  Error HTTP:", e.response.status_code)
+        except requests.RequestException as e:
+            print("  Error URL:", e)
         return data
 
     def get_data_period(self):
@@ -124,34 +203,82 @@ class WeatherData:
         self.end_date = self.start_date + timedelta(self.period)
         self.get_data()  # Populates the Data Frame
         
-    def get_data(self):
-        """ Gets the weather station data using the start and end dates """
+    def get_data(self, selection=None):
+        """ Gets the weather station data using the start and end dates
+        selection: list, optional, columns to keep (as in 'select'), with an
+            archive only these columns are read from the archived years """
         self.years = [x for x in range(self.start_date.year, self.end_date.year + 1)]
         period = self.end_date - self.start_date
         self.period = period.days
+        columns = None
+        if selection is not None:
+            # Year and DOY are needed to trim the data
+            columns = list(dict.fromkeys([self.year_col, self.doy_col] + selection))
         # Retrieve the data for every year in the range requested
-        data = []  # One Data Frame per year
-        for year in self.years:
-            self.create_url(self.station_id, year, self.dtype)
-            data.append(pd.read_csv(self.url, names=self.headers))
-            print('Retrieving data for {0} ({1})... successful!'.format(year, self.url))
-        # Concatenate the list of Data Frames into a single one
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            # One Data Frame per year
+            data = list(pool.map(lambda year: self.read_year(year, columns), self.years))
+        self.set_data(data)
+        if selection is not None:
+            self.select(selection)
+
+    def set_data(self, data):
+        """ Concatenates a list of annual Data Frames and trims it to the period """
         self.data = pd.concat(data, ignore_index=True, sort=False)
         # Select only the data between the start date and end date
         self.trim_data()
+
+    def read_year(self, year, columns=None):
+        """ Reads the weather station data of a single year into a Data Frame
+        Complete years are read from the archive, if available, otherwise the
+        text file is parsed and saved to the archive """
+        complete = year < datetime.today().year
+        if self.archive is not None and complete and self.archive.has_year(self.station_id, year, self.dtype):
+            return self.archive.read_year(self.station_id, year, self.dtype, columns)
+        url = self.create_url(self.station_id, year, self.dtype)
+        if self.cache is not None:
+            # Read the local copy of the file, downloaded only when needed
+            source = self.cache.get(self.station_id, year, self.dtype, url, self.download)
+        else:
+            source = io.BytesIO(self.download(url))
+        if self.archive is not None and complete:
+            # Archive the whole year, then keep only the requested columns
+            data = read_raw(source, self.raw_headers, no_data=self.NO_DATA)
+            self.archive.write_year(self.station_id, year, self.dtype, data)
+            data = data if columns is None else data[columns]
+        else:
+            data = read_raw(source, self.raw_headers, columns, no_data=self.NO_DATA,
+                            start_date=self.start_date, end_date=self.end_date)
+        print('Retrieving data for {0} ({1})... successful!'.format(year, url))
+        return data
         
     def trim_data(self):
         """ Trim the data to match period between start and end dates
-        WARNING! Assumes there is a column named 'DOY' with day of the year """
+        WARNING! Assumes there are columns with year and day of year """
+        self.data = self.trim(self.data)
+
+    def trim(self, data):
+        """ Returns the rows of a Data Frame between start and end dates """
         # Get day of year (DOY) for start and end dates
         start_doy = self.start_date.timetuple().tm_yday
         end_doy = self.end_date.timetuple().tm_yday
+        year, doy = data[self.year_col], data[self.doy_col]
         
-        # Drop data before start date
-        self.data.drop(self.data[(self.data['Year'] == self.start_date.year) & (self.data['DOY'] < start_doy)].index, inplace=True)
-        # Drop data after end date
-        self.data.drop(self.data[(self.data['Year'] == self.end_date.year) & (self.data['DOY'] >= end_doy)].index, inplace=True)
-        self.data = self.data.reset_index(drop=True)
+        # Drop data before start date and after end date
+        drop = ((year == self.start_date.year) & (doy < start_doy)) | \
+            ((year == self.end_date.year) & (doy >= end_doy))
+        return data[~drop].reset_index(drop=True)
+
+    def iter_data(self, selection=None):
+        """ Yields the weather station data one year at a time, so long
+        records (e.g. decades of hourly data) are kept in bounded memory
+        selection: list, optional, the columns to read """
+        columns = None
+        if selection is not None:
+            columns = list(dict.fromkeys([self.year_col, self.doy_col] + selection))
+        for year in range(self.start_date.year, self.end_date.year + 1):
+            data = self.trim(self.read_year(year, columns))
+            yield data if selection is None else data[selection]
     
     def select(self, selection):
         """ Select only the columns of the Data Frame especified in the selection list """
@@ -160,26 +287,147 @@ class WeatherData:
                 assert header in self.headers, "Header '{0}' is not a column name in DataFrame".format(header)
         self.data = self.data[selection]
         
-    def add_date(self, colname='Date'):
-        """ Adds a Date column to the weather data DataFrame
+    def add_date(self, colname='Date', tz=None):
+        """ Adds a Date column to the weather data DataFrame, the date and
+        end of the hour for hourly data (see azmet.datetime_index)
         colname: str, the name of the column to add
+        tz: str, optional, time zone of the dates, default None (naive)
         """
         assert type(colname) is str, 'The column name should be a string'
-        self.data[colname] = [self.start_date + timedelta(i) for i in range(self.period)]
+        hourly = self.timestep != 'daily'
+        hour_col = self.raw_headers[2] if hourly else None
+        if {self.year_col, self.doy_col, hour_col} - {None} <= set(self.data.columns):
+            dates = datetime_index(self.data[self.year_col], self.data[self.doy_col],
+                                   self.data[hour_col] if hourly else None, tz)
+        else:
+            # Without year and day of year, assume there are no missing rows
+            dates = pd.date_range(self.start_date, periods=len(self.data),
+                                  freq='h' if hourly else 'D', tz=tz)
+            dates = dates + pd.Timedelta(hours=1) if hourly else dates
+        self.data[colname] = dates
         self.headers = self.data.columns.values  # update headers
+
+    def hourly_to_daily(self, rules=None, min_hours=0, tz=None):
+        """
+        Daily values of the hourly data, aggregated in a single pass.
+
+        Parameters
+        ----------
+        rules : dict, optional
+            Rules of the columns to change, e.g. {'Air Temperature': 'max'},
+            the others use HOURLY_RULES ('mean' if not found there).
+        min_hours : int, optional
+            Days with fewer valid hours of a variable are NaN for that
+            variable. The default is 0.
+        tz : str, optional
+            Time zone of the dates, see azmet.datetime_index.
+
+        Returns
+        -------
+        pandas.DataFrame
+            One row per day, indexed by date, and one column per variable
+            and rule (variable_rule if there are several rules), plus
+            'Hours' with the number of hourly records of the day.
+
+        """
+        assert self.timestep != 'daily', 'The data should be hourly'
+        hour_col = self.raw_headers[2]
+        data = self.data
+        index = datetime_index(data[self.year_col], data[self.doy_col], data[hour_col], tz)
+        # Values are for the hour ending, hour 24 belongs to the day before
+        day = (index - pd.Timedelta(hours=1)).floor('D').rename('Date')
+
+        rules = dict(HOURLY_RULES, **(rules or {}))
+        columns = [c for c in data.select_dtypes('number').columns
+                   if c not in (self.year_col, self.doy_col, hour_col)]
+        values = data[columns].replace(self.NO_DATA, np.nan)
+        funcs = {c: [rules.get(c, 'mean')] if isinstance(rules.get(c, 'mean'), str)
+                 else list(rules[c]) for c in columns}
+        spec = {}
+        for col in columns:
+            if 'circmean' in funcs[col]:
+                # Mean of angles from the mean of the unit vectors
+                angle = np.radians(values[col].to_numpy(dtype=float))
+                values[col + '_sin'], values[col + '_cos'] = np.sin(angle), np.cos(angle)
+                spec[col + '_sin'] = spec[col + '_cos'] = ['mean']
+            spec[col] = [f for f in funcs[col] if f != 'circmean'] + ['count']
+        values['Hours'] = 1
+        spec['Hours'] = ['sum']
+        agg = values.groupby(day).agg(spec)
+
+        daily = {}
+        for col in columns:
+            few = agg[(col, 'count')] < max(min_hours, 1)
+            for f in funcs[col]:
+                if f == 'circmean':
+                    v = np.degrees(np.arctan2(agg[(col + '_sin', 'mean')],
+                                              agg[(col + '_cos', 'mean')])) % 360.
+                else:
+                    v = agg[(col, f)]
+                daily[col if len(funcs[col]) == 1 else '{0}_{1}'.format(col, f)] = v.where(~few)
+        daily['Hours'] = agg[('Hours', 'sum')]
+        return pd.DataFrame(daily, index=agg.index)
     
-    def fill_missing(self):
-        """ Replaces all NO_DATA values with a interpolated value """
-        replaced = 0
-        for col in self.data.columns:
-            if (self.data[col] == self.NO_DATA).any():
-                self.data[col].replace(self.NO_DATA, np.nan, inplace = True)
-                self.data[col].interpolate(inplace = True)
-                replaced += 1
-        if replaced == 0:
+    def gaps(self):
+        """ Mask of the missing values (NO_DATA or NaN) of the numeric columns
+        and a report with the missing values and longest gap per column """
+        numeric = self.data.select_dtypes('number')
+        values = numeric.to_numpy(dtype=float, copy=True)
+        missing = np.isnan(values) | (values == self.NO_DATA)
+        # Length of the gap up to each missing value, restarts after valid ones
+        count = np.cumsum(missing, axis=0)
+        run = count - np.maximum.accumulate(np.where(missing, 0, count), axis=0)
+        report = pd.DataFrame({'missing': missing.sum(axis=0),
+                               'longest_gap': run.max(axis=0, initial=0)},
+                              index=numeric.columns)
+        return values, missing, run, report
+
+    def fill_missing(self, max_gap=None):
+        """ Replaces all NO_DATA (or NaN) values with a interpolated value
+        max_gap: int, optional, only gaps with up to max_gap consecutive
+            missing values are filled, longer gaps are left as NaN
+        Gaps before the first or after the last valid value are left as NaN
+        returns: DataFrame, missing values, longest gap and values filled
+            per column """
+        values, missing, run, report = self.gaps()
+        # Total length of the gap for every missing value
+        count = np.cumsum(missing[::-1], axis=0)
+        run_back = (count - np.maximum.accumulate(np.where(missing[::-1], 0, count), axis=0))[::-1]
+        length = run + run_back - 1
+        # Only the gaps between the first and last valid values are filled
+        interior = (np.cumsum(~missing, axis=0) > 0) & (np.cumsum(~missing[::-1], axis=0) > 0)[::-1]
+        fill = missing & interior
+        if max_gap is not None:
+            fill &= length <= max_gap
+
+        # Interpolation is time-aware if there are dates
+        if isinstance(self.data.index, pd.DatetimeIndex):
+            x = self.data.index.asi8.astype(float)
+        elif 'Date' in self.data.columns:
+            x = pd.DatetimeIndex(self.data['Date']).asi8.astype(float)
+        else:
+            x = np.arange(len(self.data), dtype=float)
+
+        report['filled'] = fill.sum(axis=0)
+        for j in np.flatnonzero(report['missing'].to_numpy()):
+            col = report.index[j]
+            valid = ~missing[:, j]
+            column = values[:, j]
+            column[missing[:, j]] = np.nan
+            if valid.any():
+                column[fill[:, j]] = np.interp(x[fill[:, j]], x[valid], column[valid])
+            dtype = self.data[col].dtype
+            if np.isnan(column).any():
+                # Integer columns cannot hold the gaps left
+                dtype = np.result_type(dtype, np.float32)
+            self.data[col] = column.astype(dtype)
+        
+        replaced = report['filled'].sum()
+        if report['missing'].sum() == 0:
             print('No missing values found!')
         else:
             print('{0} missing values were filled successfully!'.format(replaced))
+        return report
         
     def daily_averages(self):
         """ Computes the daily average of the variables using the annual data """
@@ -201,7 +449,7 @@ class WeatherData:
             i = 0
             for annual in annual_data:
                 # print(self.years[i], len(annual))
-                date_ = datetime(self.years[i], date.month, date.day).date() # date
+                date_ = pd.Timestamp(self.years[i], date.month, date.day) # date
                 row = annual.loc[date_]
                 # print(date, date_, row['SR'])
         
@@ -218,6 +466,7 @@ class WeatherData:
         if _ylabel == '':
             _ylabel = ' / '.join(variables)
         
+        plt = pyplot()
         plt.figure()
         for variable in variables:
             plt.scatter(self.data['DOY'], self.data[variable], label=variable)
@@ -228,8 +477,124 @@ class WeatherData:
             plt.savefig(_filename, dpi=_res, bbox_inches='tight')
         plt.grid(True)
         plt.xlim(0, 366)
-        plt.show()
+        show()
+
+
+def get_stations_data(stations, start_date, end_date, timestep='daily', **kwargs):
+    """
+    Retrieves the data of several weather stations in a single Data Frame.
+    The files of all the stations and years are retrieved at the same time
+    using a pool of threads and a single HTTP session.
+
+    Parameters
+    ----------
+    stations : list
+        Names of the weather stations.
+    start_date : datetime
+        Start date of the period.
+    end_date : datetime
+        End date of the period.
+    timestep : str, optional
+        'daily' or 'hourly'. The default is 'daily'.
+    workers : int, optional
+        Number of files retrieved at the same time. The default is 8.
+    cache : WeatherCache, optional
+        Local cache of the annual files. The default is None.
+    session : requests.Session, optional
+        HTTP session to share the connections. The default is a new one.
+    base_url : str, optional
+        URL of the website with the weather station files.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The data of all the stations, indexed by station name and row.
+
+    """
+    _workers = kwargs.get('workers', 8)
+    _session = kwargs.get('session', None) or create_session(_workers)
+    objs = []
+    for station in stations:
+        ws = WeatherData(station, start_date, timestep)
+        ws.set_end_date(end_date)
+        ws.set_session(_session)
+        ws.set_cache(kwargs.get('cache', None))
+        if 'base_url' in kwargs:
+            ws.set_base_url(kwargs['base_url'])
+        ws.years = [x for x in range(ws.start_date.year, ws.end_date.year + 1)]
+        ws.period = (ws.end_date - ws.start_date).days
+        objs.append(ws)
+
+    # Retrieve all the (station, year) files with a single pool of threads
+    with ThreadPoolExecutor(max_workers=_workers) as pool:
+        futures = [[pool.submit(ws.read_year, year) for year in ws.years] for ws in objs]
+        for ws, station_futures in zip(objs, futures):
+            ws.set_data([f.result() for f in station_futures])
+    return pd.concat([ws.data for ws in objs], keys=stations, names=['Name', None])
 
+def daytime_percentage(lat, month, north=True, filename=DAYTIME_HOURS_FILE):
+    """
+    Mean Daily Percentage of Annual Daytime Hours, p, interpolated for the
+    latitude. All the parameters are broadcast, so p is obtained for every
+    day of several stations in a single call.
+
+    Parameters
+    ----------
+    lat : float or array_like
+        Latitude in degrees [0-90], values over 60 use the 60 degrees column.
+    month : int or array_like
+        Calendar month, 1 to 12.
+    north : bool or array_like, optional
+        True for Northern hemisphere. The default is True.
+    filename : str, optional
+        File with the daytime hours table.
+
+    Returns
+    -------
+    float or ndarray
+        The value of p for each latitude and month.
+
+    """
+    latitudes, table = daytime_hours_array(filename)
+    lat, month, north = np.broadcast_arrays(np.asarray(lat, dtype=float),
+                                            np.asarray(month, dtype=int),
+                                            np.asarray(north, dtype=bool))
+    # Interpolate only once for each different latitude
+    ulat, inv = np.unique(lat, return_inverse=True)
+    j = np.clip(np.searchsorted(latitudes, ulat, side='right') - 1, 0, len(latitudes) - 2)
+    w = np.clip((ulat - latitudes[j]) / (latitudes[j+1] - latitudes[j]), 0., 1.)
+    p = table[:, :, j] * (1. - w) + table[:, :, j+1] * w  # (2, 12, latitudes)
+    return p[np.where(north, 0, 1), month - 1, inv.reshape(lat.shape)][()]
+
+def blaney_criddle_f(data, lat, north=True, date_col='Date', temp_col='TMean'):
+    """
+    The 'f' of Blaney-Criddle method, f = p(0.46*T+8.13), for a whole
+    Data Frame, e.g. the combined data of several stations.
+
+    Parameters
+    ----------
+    data : pandas.DataFrame
+        Data with the dates and mean temperature.
+    lat : float, array_like or str
+        Latitude of each row, or the name of a column with the latitudes.
+    north : bool, array_like or str, optional
+        Northern hemisphere, or the name of a column. The default is True.
+    date_col : str, optional
+        Column with the dates. The default is 'Date'.
+    temp_col : str, optional
+        Column with the mean temperature. The default is 'TMean'.
+
+    Returns
+    -------
+    pandas.Series
+        The values of 'f'.
+
+    """
+    lat = data[lat] if isinstance(lat, str) else lat
+    north = data[north] if isinstance(north, str) else north
+    months = pd.DatetimeIndex(data[date_col]).month
+    p = daytime_percentage(np.asarray(lat), np.asarray(months), np.asarray(north))
+    return (p * (0.46 * data[temp_col] + 8.13)).rename('f')
 
 class BlanneyCriddle(WeatherData):
     def __init__(self, station, start_date, timestep, lat, north=True):
@@ -246,9 +611,9 @@ class BlanneyCriddle(WeatherData):
     def calculate_months(self):
         self.months = [x for x in range(self.start_date.month, self.end_date.month+1)]
  
-    def read_daytime_hours(self, filename='../doc/daytime_mean_hours.csv'):
+    def read_daytime_hours(self, filename=DAYTIME_HOURS_FILE):
         """ Mean Daily Percentage of Annual Daytime Hours, p, by month for different Latitudes """
-        self.daytime_hours_table = pd.read_csv(filename)
+        self.daytime_hours_table = read_daytime_hours(filename)
     
     def linterpol(self, x0, y0, x1, y1, x):
         """ Linear interpolation """
@@ -262,54 +627,21 @@ class BlanneyCriddle(WeatherData):
         self.p_name = colname  # column name for 'p'
         self.calculate_months()  # Update the months list to compute ET
         self.read_daytime_hours()
-        # Column headers of the daytime houts table are latitudes in degrees
-        latitudes = [int(x) for x in self.daytime_hours_table.columns.values[2:]]
-        # Find the values between which latitude lies, x0 and x1
-        x0 = latitudes[-1]
-        x1 = latitudes[-1]
-        for i in range(len(latitudes) - 1):
-            if self.lat >= latitudes[i] and self.lat < latitudes[i+1]:
-                x0 = latitudes[i]
-                x1 = latitudes[i+1]
-
-        row_months = self.daytime_hours_table[self.hemisphere]
-        # Select rows for especified months, the percentage of daytime hours
-        # will be the same in the whole month
-        daytime_per_month = self.daytime_hours_table.loc[row_months.isin(self.months)]
-        # Select the latitude columns
-        if x0 == x1:
-            # Any value of latitude >= 60 use the last column
-            daytime_per_month = daytime_per_month[[self.hemisphere, str(x0)]]
-            # Rename to 'p' the column with values corresponding to latiude
-            daytime_per_month.rename(columns={str(x0):self.p_name}, inplace=True)
-        else:
-            # Otherwise, interpolate between columns x0 and x1
-            interp = []
-            for month in self.months:
-                y0 = float(daytime_per_month.loc[daytime_per_month[self.hemisphere] == month][str(x0)])
-                y1 = float(daytime_per_month.loc[daytime_per_month[self.hemisphere] == month][str(x1)])
-                # Interpolate for the latitude, add all the values to a list
-                interp.append(self.linterpol(x0, y0, x1, y1, self.lat))
-            daytime_per_month = daytime_per_month[[self.hemisphere, str(x0), str(x1)]]
-            # Add a column named 'p' with the values corresponding to latiude
-            daytime_per_month[self.p_name] = interp
-        
-        self.daytime_per_month = daytime_per_month.reset_index(drop=True)
+        # Interpolate the latitude for all the months at once
+        self.daytime_per_month = pd.DataFrame({
+            self.hemisphere: self.months,
+            self.p_name: daytime_percentage(self.lat, self.months, self.north)})
         print(self.daytime_per_month)
         
     def daytime_hours_daily(self):
         """ Set the Mean Daily Percentage of Annual Daytime Hours, p, for
         each day of the period according to its corresponding month """
         assert 'Date' in self.data.columns, 'No Date column in data'
-        self.daytime_per_day = []
-        for date in self.data['Date']:
-            # Get the daily value 'p' from the corresponding month and hemisphere
-            p = self.daytime_per_month[self.daytime_per_month[self.hemisphere] == date.month][self.p_name]
-            # List with all the daily values for 'p'
-            self.daytime_per_day.append(float(p))
-
-        # Append the list of daily values for 'p', 'data' in inherited from WeatherData
-        self.data['p'] = self.daytime_per_day.copy()
+        months = pd.DatetimeIndex(self.data['Date']).month
+        self.daytime_per_day = daytime_percentage(self.lat, months, self.north)
+
+        # Append the daily values for 'p', 'data' in inherited from WeatherData
+        self.data['p'] = self.daytime_per_day
         
     def calculate_f(self):
         """ Calculate the 'f' of Blaney-Criddle method
@@ -326,6 +658,40 @@ if __name__ == '__main__':
     day = 1
     duration = 120
     
+    # 0. TEST STREAMING AFTER ADDING DATES, OFFLINE WITH SYNTHETIC FILES
+    import tempfile
+    from cache import WeatherCache
+    cache = WeatherCache(tempfile.mkdtemp(), offline=True)
+    hourly = registry.headers('hourly')
+    for yr in (2004, 2005):
+        days = pd.Timestamp(yr, 12, 31).dayofyear
+        raw = np.zeros((days * 24, len(hourly)))
+        raw[:, 0], raw[:, 2] = yr, np.tile(np.arange(1, 25), days)
+        raw[:, 1] = np.repeat(np.arange(1, days + 1), 24)
+        raw[:, 3] = 20.
+        np.savetxt(cache.path(registry.station_id(station), yr, 'rh'), raw,
+                   fmt='%g', delimiter=',')
+    ws = WeatherData(station, datetime(2004, 12, 1), 'hourly')
+    ws.set_end_date(datetime(2005, 2, 1))
+    ws.set_cache(cache)
+    ws.get_data()
+    ws.add_date()
+    assert ws.data['Date'].iloc[-1] == pd.Timestamp(2005, 2, 1), 'Wrong hourly dates'
+    chunks = list(ws.iter_data([hourly[3]]))
+    assert [len(c) for c in chunks] == [31 * 24, 31 * 24], 'Wrong streamed years'
+    ws.get_data()
+    assert len(ws.data) == 62 * 24, 'Wrong hourly data after adding dates'
+
+    # Gaps at the start and end are not filled, the interior ones are
+    ws.data[hourly[3]] = ws.data[hourly[3]].astype(float)
+    ws.data.loc[:1, hourly[3]] = ws.NO_DATA
+    ws.data.loc[10:12, hourly[3]] = ws.NO_DATA
+    ws.data.loc[len(ws.data) - 3:, hourly[3]] = ws.NO_DATA
+    report = ws.fill_missing(max_gap=5)
+    assert report.loc[hourly[3], 'filled'] == 3, 'Edge gaps should not be filled'
+    temp = ws.data[hourly[3]]
+    assert temp[:2].isna().all() and temp[-3:].isna().all() and (temp[2:-3] == 20.).all()
+
     # # 1. TEST WEATHER CLASS FOR A PRESET DURATION
     # ws = WeatherData(station, datetime(year,month,day), 'daily')
     # ws.set_period(duration)